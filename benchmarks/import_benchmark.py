@@ -0,0 +1,83 @@
+"""
+Import time benchmark for the xeniadbutilities entry points the ingest jobs start from.
+
+Times importing json_obs_map, SQLiteMPDataSaver and wqDB, plus the two ORM modules for reference, each in a fresh
+interpreter so nothing is already in sys.modules, and reports the min, median and max over the repeats. It also
+reports whether the import pulled in sqlalchemy or geoalchemy2, which the entry points only load on first use.
+
+Usage, from the repository root:
+  python benchmarks/import_benchmark.py
+  python benchmarks/import_benchmark.py --repeats 20 --entry-points json_obs_map wqdb --csv out.csv
+"""
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENTRY_POINTS = {
+    'json_obs_map': "from xeniadbutilities.xenia_obs_map import json_obs_map",
+    'sqlite_mp_saver': "from xeniadbutilities.SQLiteMultiProcDataSaver import SQLiteMPDataSaver",
+    'wqdb': "from xeniadbutilities.wqDatabase import wqDB",
+    'xenia_sqlite_alchemy': "from xeniadbutilities.xeniaSQLiteAlchemy import xeniaAlchemy",
+    'xenia_pg_alchemy': "from xeniadbutilities.xeniaSQLAlchemy import xeniaAlchemy",
+}
+HEAVY_MODULES = ('sqlalchemy', 'geoalchemy2')
+RESULT_COLUMNS = ('entry_point', 'repeats', 'min_ms', 'median_ms', 'max_ms', 'loads_sqlalchemy', 'loads_geoalchemy2')
+
+
+def run_case(entry_point):
+    start = time.perf_counter()
+    exec(ENTRY_POINTS[entry_point], {})
+    seconds = time.perf_counter() - start
+    result = {'seconds': seconds}
+    for module in HEAVY_MODULES:
+        result['loads_%s' % (module)] = module in sys.modules
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the xeniadbutilities entry points.")
+    parser.add_argument('--entry-points', nargs='+', choices=list(ENTRY_POINTS), default=list(ENTRY_POINTS))
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--csv', help="Also write the results to this CSV file.")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case)))
+        return
+
+    results = []
+    print(','.join(RESULT_COLUMNS))
+    for entry_point in args.entry_points:
+        timings = []
+        for repeat in range(args.repeats):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', entry_point],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True)
+            case_result = json.loads(output.stdout.strip().splitlines()[-1])
+            timings.append(case_result['seconds'] * 1000)
+        result = {'entry_point': entry_point,
+                  'repeats': args.repeats,
+                  'min_ms': round(min(timings), 2),
+                  'median_ms': round(statistics.median(timings), 2),
+                  'max_ms': round(max(timings), 2)}
+        for module in HEAVY_MODULES:
+            result['loads_%s' % (module)] = case_result['loads_%s' % (module)]
+        results.append(result)
+        print(','.join(str(result[column]) for column in RESULT_COLUMNS), flush=True)
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Ingest benchmark for the multi_obs write paths.
+
+Runs SQLiteMPDataSaver, MPDataSaverV2, xeniaSQLite.addMeasurementWithMType and wqDB.addMeasurementWithMType against
+a fresh SQLite file with the same synthetic observations, for every combination of row count, batch size and
+duplicate ratio, and reports rows/sec, peak RSS and the number of commits.
+
+Each case runs in its own interpreter so peak RSS is not carried from one case to the next. The observations are
+generated from a fixed seed, so results are comparable between runs and branches.
+
+Usage, from the repository root:
+  python benchmarks/ingest_benchmark.py
+  python benchmarks/ingest_benchmark.py --rows 10000 --batch-sizes 100 1000 --duplicate-ratios 0 0.25 --csv out.csv
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PATHS = ('sqlite_mp_saver', 'mp_saver_v2', 'xenia_sqlite', 'wqdb')
+SENSOR_COUNT = 50
+PLATFORM_HANDLE = 'bench.platform.met'
+M_TYPE_ID = 1
+# Most records handed to a saver's add_records() per call. Smaller batch sizes use the batch size, since a saver
+# writes each queued list whole.
+PRODUCER_CHUNK = 1000
+START_DATE = datetime(2024, 1, 1)
+RESULT_COLUMNS = ('path', 'rows', 'batch_size', 'duplicate_ratio', 'seconds', 'rows_per_sec', 'rows_inserted',
+                  'commits', 'peak_rss_kb')
+
+
+def observation_keys(rows, duplicate_ratio, seed):
+    """(sensor_id, m_date) for each row. duplicate_ratio of the rows repeat a key used earlier in the workload."""
+    rng = random.Random(seed)
+    unique_count = rows - int(rows * duplicate_ratio)
+    keys = [((ndx % SENSOR_COUNT) + 1, START_DATE + timedelta(minutes=ndx // SENSOR_COUNT))
+            for ndx in range(unique_count)]
+    # Each repeat is placed somewhere after the row it duplicates, the way a re-polled feed resends it.
+    positions = list(range(unique_count))
+    for ndx in range(rows - unique_count):
+        source = rng.randrange(unique_count)
+        positions.append(source + rng.random() * (unique_count - source))
+        keys.append(keys[source])
+    return [key for position, key in sorted(zip(positions, keys), key=lambda item: item[0])]
+
+
+def create_database(db_file):
+    from sqlalchemy import create_engine
+    from xeniadbutilities.xeniaSQLiteAlchemy import Base
+
+    engine = create_engine(f"sqlite:///{db_file}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    # Duplicates have to be rejected by the database for the duplicate ratio to mean anything.
+    connection = sqlite3.connect(db_file)
+    connection.execute("CREATE UNIQUE INDEX multi_obs_sensor_date ON multi_obs (sensor_id, m_date)")
+    connection.commit()
+    connection.close()
+
+
+def count_rows(db_file):
+    connection = sqlite3.connect(db_file)
+    count = connection.execute("SELECT count(*) FROM multi_obs").fetchone()[0]
+    connection.close()
+    return count
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux. The saver processes are waited for children of this interpreter.
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def saver_commits(metrics_queue):
+    # The savers publish a final snapshot when they finish, the last one has the totals.
+    commits = 0
+    while not metrics_queue.empty():
+        commits = metrics_queue.get()['commits']
+    return commits
+
+
+def run_sqlite_mp_saver(db_file, work_dir, keys, batch_size):
+    from xeniadbutilities.SQLiteMultiProcDataSaver import SQLiteMPDataSaver
+    from xeniadbutilities.multi_obs_writer import WIRE_FORMAT_TUPLE
+    from xeniadbutilities.xeniaSQLiteAlchemy import multi_obs
+
+    log_config_file = os.path.join(work_dir, 'bench_logging.conf')
+    with open(log_config_file, 'w') as log_config:
+        log_config.write("[loggers]\nkeys=root\n[handlers]\nkeys=null\n[formatters]\nkeys=\n"
+                         "[logger_root]\nlevel=WARNING\nhandlers=null\n"
+                         "[handler_null]\nclass=NullHandler\nargs=()\n")
+    metrics_queue = Queue()
+    saver = SQLiteMPDataSaver(db_file, log_config_file, batch_size=batch_size, wire_format=WIRE_FORMAT_TUPLE,
+                              metrics_queue=metrics_queue)
+    saver.start()
+    chunk = min(batch_size, PRODUCER_CHUNK)
+    for start in range(0, len(keys), chunk):
+        saver.add_records([multi_obs(platform_handle=PLATFORM_HANDLE, sensor_id=sensor_id, m_type_id=M_TYPE_ID,
+                                     m_date=m_date.isoformat(), m_value=1.0)
+                           for sensor_id, m_date in keys[start:start + chunk]])
+    saver.data_queue.put(None)
+    saver.join()
+    return saver_commits(metrics_queue)
+
+
+def run_mp_saver_v2(db_file, work_dir, keys, batch_size):
+    from xeniadbutilities.MultiProcDataSaverV2 import MPDataSaverV2
+    from xeniadbutilities.multi_obs_writer import WIRE_FORMAT_TUPLE
+    from xeniadbutilities.xeniaSQLAlchemy import multi_obs
+
+    metrics_queue = Queue()
+    saver = MPDataSaverV2()
+    saver.initialize(log_config={'handlers': {'file_handler': {'filename': os.path.join(work_dir, 'bench.log')}}},
+                     db_connection_type='sqlite', db_name=db_file, records_before_commit=batch_size,
+                     wire_format=WIRE_FORMAT_TUPLE, metrics_queue=metrics_queue)
+    saver.start()
+    chunk = min(batch_size, PRODUCER_CHUNK)
+    for start in range(0, len(keys), chunk):
+        saver.add_records([multi_obs(platform_handle=PLATFORM_HANDLE, sensor_id=sensor_id, m_type_id=M_TYPE_ID,
+                                     m_date=m_date, m_value=1.0)
+                           for sensor_id, m_date in keys[start:start + chunk]])
+    saver.data_queue.put(None)
+    saver.join()
+    return saver_commits(metrics_queue)
+
+
+def run_xenia_sqlite(db_file, work_dir, keys, batch_size):
+    from xeniadbutilities.xenia import xeniaSQLite
+
+    db = xeniaSQLite()
+    db.connect(db_file)
+    # procTraceback prints every rejected duplicate, which would time the console instead of the inserts.
+    db.procTraceback = lambda: None
+    commits = 0
+    for ndx, (sensor_id, m_date) in enumerate(keys, 1):
+        db.addMeasurementWithMType(M_TYPE_ID, sensor_id, PLATFORM_HANDLE, m_date.isoformat(), 0.0, 0.0, 0.0, [1.0],
+                                   autoCommit=False)
+        if (ndx % batch_size) == 0:
+            db.commit()
+            commits += 1
+    if len(keys) % batch_size:
+        db.commit()
+        commits += 1
+    db.DB.close()
+    return commits
+
+
+def run_wqdb(db_file, work_dir, keys, batch_size):
+    from xeniadbutilities.wqDatabase import wqDB
+
+    db = wqDB(db_file, use_logger=False)
+    commits = 0
+    for ndx, (sensor_id, m_date) in enumerate(keys, 1):
+        try:
+            db.addMeasurementWithMType(M_TYPE_ID, sensor_id, PLATFORM_HANDLE, m_date.isoformat(), 0.0, 0.0, 0.0,
+                                       [1.0], autoCommit=False)
+        except sqlite3.IntegrityError:
+            pass
+        if (ndx % batch_size) == 0:
+            db.DB.commit()
+            commits += 1
+    if len(keys) % batch_size:
+        db.DB.commit()
+        commits += 1
+    return commits
+
+
+RUNNERS = {
+    'sqlite_mp_saver': run_sqlite_mp_saver,
+    'mp_saver_v2': run_mp_saver_v2,
+    'xenia_sqlite': run_xenia_sqlite,
+    'wqdb': run_wqdb,
+}
+
+
+def run_case(case):
+    """Runs one case in this interpreter and returns its result row."""
+    work_dir = tempfile.mkdtemp(prefix='xenia_ingest_bench_')
+    db_file = os.path.join(work_dir, 'bench.db')
+    create_database(db_file)
+    keys = observation_keys(case['rows'], case['duplicate_ratio'], case['seed'])
+
+    start_time = time.perf_counter()
+    commits = RUNNERS[case['path']](db_file, work_dir, keys, case['batch_size'])
+    seconds = time.perf_counter() - start_time
+
+    result = dict(case)
+    del result['seed']
+    result.update({
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(case['rows'] / seconds, 1),
+        'rows_inserted': count_rows(db_file),
+        'commits': commits,
+        'peak_rss_kb': peak_rss_kb(),
+    })
+    for filename in os.listdir(work_dir):
+        os.remove(os.path.join(work_dir, filename))
+    os.rmdir(work_dir)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the multi_obs ingest paths on SQLite.")
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=list(PATHS))
+    parser.add_argument('--rows', nargs='+', type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[100, 1000, 10000])
+    parser.add_argument('--duplicate-ratios', nargs='+', type=float, default=[0.0, 0.1, 0.5])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--csv', help="Also write the results to this CSV file.")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    results = []
+    print(','.join(RESULT_COLUMNS))
+    for rows in args.rows:
+        for batch_size in args.batch_sizes:
+            for duplicate_ratio in args.duplicate_ratios:
+                for path in args.paths:
+                    case = {'path': path, 'rows': rows, 'batch_size': batch_size, 'duplicate_ratio': duplicate_ratio,
+                            'seed': args.seed}
+                    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+                                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True)
+                    result = json.loads(output.stdout.strip().splitlines()[-1])
+                    results.append(result)
+                    print(','.join(str(result[column]) for column in RESULT_COLUMNS), flush=True)
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Micro-benchmark for the xeniaAlchemy *Exists lookups.
+
+Compares the per-call time of each lookup method with the ORM query chain it used to build on every call, against a
+SQLite database provisioned with a few platforms. sensorExists is measured with its sensor_cache cleared before each
+call so the database lookup is what gets timed.
+
+Usage, from the repository root:
+  python benchmarks/lookup_benchmark.py
+  python benchmarks/lookup_benchmark.py --calls 20000 --csv out.csv
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PLATFORM_COUNT = 20
+OBSERVATIONS = (('air_temperature', 'celsius'), ('wind_speed', 'm_s-1'), ('water_level', 'm'))
+RESULT_COLUMNS = ('lookup', 'calls', 'query_chain_us', 'cached_statement_us', 'speedup')
+
+
+def create_database(db_file):
+    from sqlalchemy import create_engine
+    from xeniadbutilities.xeniaSQLiteAlchemy import Base, xeniaAlchemy
+
+    engine = create_engine(f"sqlite:///{db_file}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    db = xeniaAlchemy()
+    db.connect_sqlite_db(db_file)
+    db.provision_platforms([{'platform_handle': 'bench.platform%d.met' % (ndx),
+                             'observations': [{'obs_name': obs_name, 'uom_name': uom, 's_order': 1}
+                                              for obs_name, uom in OBSERVATIONS]}
+                            for ndx in range(PLATFORM_COUNT)])
+    return db
+
+
+def query_chains(db):
+    """The query chains the lookups built before they used prebuilt statements."""
+    from xeniadbutilities.xeniaSQLiteAlchemy import platform, sensor, m_type, m_scalar_type, obs_type, uom_type
+
+    def sensor_exists(obs_name, uom, platform_handle, s_order=1):
+        return db.session.query(sensor.row_id) \
+            .join(platform, platform.row_id == sensor.platform_id) \
+            .join(m_type, m_type.row_id == sensor.m_type_id) \
+            .join(m_scalar_type, m_scalar_type.row_id == m_type.m_scalar_type_id) \
+            .join(obs_type, obs_type.row_id == m_scalar_type.obs_type_id) \
+            .join(uom_type, uom_type.row_id == m_scalar_type.uom_type_id) \
+            .filter(sensor.s_order == s_order) \
+            .filter(platform.platform_handle == platform_handle) \
+            .filter(obs_type.standard_name == obs_name) \
+            .filter(uom_type.standard_name == uom).one().row_id
+
+    def m_type_exists(obs_name, uom):
+        return db.session.query(m_type.row_id) \
+            .join(m_scalar_type, m_scalar_type.row_id == m_type.m_scalar_type_id) \
+            .join(obs_type, obs_type.row_id == m_scalar_type.obs_type_id) \
+            .join(uom_type, uom_type.row_id == m_scalar_type.uom_type_id) \
+            .filter(obs_type.standard_name == obs_name) \
+            .filter(uom_type.standard_name == uom).one().row_id
+
+    def platform_exists(platform_handle):
+        return db.session.query(platform.row_id).filter(platform.platform_handle == platform_handle).one().row_id
+
+    def obs_type_exists(obs_name):
+        return db.session.query(obs_type.row_id).filter(obs_type.standard_name == obs_name).one().row_id
+
+    def scalar_type_exists(obs_type_id, uom_type_id):
+        return db.session.query(m_scalar_type.row_id) \
+            .filter(m_scalar_type.obs_type_id == obs_type_id) \
+            .filter(m_scalar_type.uom_type_id == uom_type_id).one().row_id
+
+    return {'sensorExists': sensor_exists, 'mTypeExists': m_type_exists, 'platformExists': platform_exists,
+            'obsTypeExists': obs_type_exists, 'scalarTypeExists': scalar_type_exists}
+
+
+def lookup_args(lookup, ndx):
+    obs_name, uom = OBSERVATIONS[ndx % len(OBSERVATIONS)]
+    platform_handle = 'bench.platform%d.met' % (ndx % PLATFORM_COUNT)
+    if lookup == 'sensorExists':
+        return obs_name, uom, platform_handle
+    if lookup == 'mTypeExists':
+        return obs_name, uom
+    if lookup == 'platformExists':
+        return (platform_handle,)
+    if lookup == 'obsTypeExists':
+        return (obs_name,)
+    return (ndx % len(OBSERVATIONS)) + 1, (ndx % len(OBSERVATIONS)) + 1
+
+
+def time_calls(db, lookup, method, calls):
+    args = [lookup_args(lookup, ndx) for ndx in range(calls)]
+    start = time.perf_counter()
+    for call_args in args:
+        if lookup == 'sensorExists':
+            db.sensor_cache.invalidate()
+        method(*call_args)
+    return (time.perf_counter() - start) / calls * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-call cost of the xeniaAlchemy *Exists lookups.")
+    parser.add_argument('--calls', type=int, default=5000)
+    parser.add_argument('--csv', help="Also write the results to this CSV file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        db = create_database(os.path.join(work_dir, 'lookup_benchmark.db'))
+        chains = query_chains(db)
+        results = []
+        print(','.join(RESULT_COLUMNS))
+        for lookup, chain in chains.items():
+            method = getattr(db, lookup)
+            # Warm both paths so the compiled caches are populated before timing.
+            time_calls(db, lookup, chain, 100)
+            time_calls(db, lookup, method, 100)
+            chain_us = time_calls(db, lookup, chain, args.calls)
+            method_us = time_calls(db, lookup, method, args.calls)
+            result = {'lookup': lookup,
+                      'calls': args.calls,
+                      'query_chain_us': round(chain_us, 1),
+                      'cached_statement_us': round(method_us, 1),
+                      'speedup': round(chain_us / method_us, 2)}
+            results.append(result)
+            print(','.join(str(result[column]) for column in RESULT_COLUMNS), flush=True)
+        db.disconnect()
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
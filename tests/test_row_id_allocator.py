@@ -0,0 +1,60 @@
+from sqlalchemy import create_engine
+
+from xeniadbutilities.xenia import xeniaSQLite
+from xeniadbutilities.xeniaSQLiteAlchemy import Base, xeniaAlchemy
+
+
+def connect(tmp_path):
+    db_file = str(tmp_path / "xenia.db")
+    engine = create_engine("sqlite:///" + db_file)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    db = xeniaAlchemy()
+    assert db.connect_sqlite_db(db_file)
+    legacy = xeniaSQLite()
+    assert legacy.connect(db_file)
+    return db, legacy
+
+
+def obs_type_names(legacy):
+    return {row['row_id']: row['standard_name']
+            for row in legacy.DB.execute("SELECT row_id, standard_name FROM obs_type").fetchall()}
+
+
+def test_orm_add_after_legacy_writer_takes_cached_id(tmp_path):
+    db, legacy = connect(tmp_path)
+    try:
+        first_id = db.addObsType('a')
+        # xeniaSQLite inserts with the table's next rowid, which is inside the allocator's cached block.
+        legacy_id = legacy.addObsType('b')
+        assert legacy_id == first_id + 1
+
+        third_id = db.addObsType('c')
+        assert third_id is not None
+        assert obs_type_names(legacy) == {first_id: 'a', legacy_id: 'b', third_id: 'c'}
+
+        # The allocator keeps handing out ids from the new block.
+        assert db.addObsType('d') == third_id + 1
+    finally:
+        db.disconnect()
+        legacy.DB.close()
+
+
+def test_provisioning_after_legacy_writer_takes_cached_id(tmp_path):
+    db, legacy = connect(tmp_path)
+    try:
+        assert db.addUOMType('celsius') is not None
+        first_id = db.addObsType('a')
+        legacy_id = legacy.addObsType('b')
+
+        resolved = db.provision_platforms([{'platform_handle': 'org.platform.met',
+                                            'observations': [{'obs_name': 'c', 'uom_name': 'celsius'}]}])
+        assert resolved[('c', 'celsius', 'org.platform.met', 1)][0] is not None
+        names = obs_type_names(legacy)
+        assert names[first_id] == 'a'
+        assert names[legacy_id] == 'b'
+        assert sorted(names.values()) == ['a', 'b', 'c']
+    finally:
+        db.disconnect()
+        legacy.DB.close()
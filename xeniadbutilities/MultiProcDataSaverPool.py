@@ -0,0 +1,78 @@
+from multiprocessing import Queue
+
+from .MultiProcDataSaverV2 import MPDataSaverV2
+from .multi_obs_writer import multi_obs_to_tuple, record_sensor_id, put_record, WIRE_FORMAT_ORM, WIRE_FORMAT_TUPLE, \
+    QUEUE_FULL_BLOCK
+
+
+class MPDataSaverPool:
+    """
+    Function: __init__
+    Purpose: Creates a pool of MPDataSaverV2 workers, each with its own queue. Records are routed to a worker by
+    hashing their sensor_id, so all the rows for a sensor are written by the same worker in the order they were added.
+    Parameters:
+      worker_count is the number of saver processes to start.
+      kwargs are passed to each worker's initialize(), data_queue is created per worker by the pool, bounded to
+        max_queue_size entries. If spool_file is given each worker spools to its own file, spool_file with the
+        worker index appended.
+    """
+
+    def __init__(self, worker_count, **kwargs):
+        if worker_count < 1:
+            raise ValueError("worker_count must be at least 1.")
+        self._wire_format = kwargs.get('wire_format', WIRE_FORMAT_ORM)
+        self._queue_full_policy = kwargs.get('queue_full_policy', QUEUE_FULL_BLOCK)
+        self._dropped_records = 0
+        self._workers = []
+        self._queues = []
+        for worker_ndx in range(worker_count):
+            data_queue = Queue(maxsize=kwargs.get('max_queue_size', 0))
+            worker_kwargs = dict(kwargs, data_queue=data_queue)
+            if kwargs.get('spool_file', None) is not None:
+                worker_kwargs['spool_file'] = "%s.%d" % (kwargs['spool_file'], worker_ndx)
+            worker = MPDataSaverV2()
+            worker.initialize(**worker_kwargs)
+            self._workers.append(worker)
+            self._queues.append(data_queue)
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def dropped_records(self):
+        return self._dropped_records
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def worker_index(self, sensor_id):
+        return hash(sensor_id) % len(self._queues)
+
+    def add_records(self, records):
+        if self._wire_format == WIRE_FORMAT_TUPLE:
+            worker_records = [[] for data_queue in self._queues]
+            for rec in records:
+                rec = multi_obs_to_tuple(rec)
+                worker_records[self.worker_index(record_sensor_id(rec))].append(rec)
+            for worker_ndx, recs in enumerate(worker_records):
+                if recs:
+                    self._dropped_records += put_record(self._queues[worker_ndx], recs, self._queue_full_policy)
+        else:
+            for rec in records:
+                self._dropped_records += put_record(self._queues[self.worker_index(rec.sensor_id)], rec,
+                                                    self._queue_full_policy)
+
+    """
+    Function: stop
+    Purpose: Sends the None stop sentinel to every worker. Records already queued are written before a worker exits.
+    """
+
+    def stop(self):
+        for data_queue in self._queues:
+            data_queue.put(None)
+
+    def join(self, timeout=None):
+        for worker in self._workers:
+            worker.join(timeout)
@@ -4,8 +4,9 @@ from multiprocessing import Process, Queue, current_process
 
 import time
 import logging.config
-from sqlalchemy import exc
-from .xeniaSQLAlchemy import xeniaAlchemy
+from .multi_obs_writer import MultiObsSaverLoop, multi_obs_to_tuple, put_record, WIRE_FORMAT_ORM, \
+    WIRE_FORMAT_TUPLE, QUEUE_FULL_BLOCK
+from .saver_metrics import SaverMetrics
 
 
 class MPDataSaverV2(Process):
@@ -23,19 +24,65 @@ class MPDataSaverV2(Process):
     def initialize(self, **kwargs):
         self._logger_name = kwargs.get('logger_name', 'data_saver_logger')
         self._log_config = kwargs['log_config']
-        self._data_queue = kwargs['data_queue']
+        # If no data_queue is given, one bounded to max_queue_size entries is created.
+        self._data_queue = kwargs.get('data_queue', None)
+        if self._data_queue is None:
+            self._data_queue = Queue(maxsize=kwargs.get('max_queue_size', 0))
         self._db_user = kwargs.get('db_user', None)
         self._db_pwd = kwargs.get('db_pwd', None)
         self._db_host = kwargs.get('db_host', None)
         self._db_name = kwargs.get('db_name', None)
         self._db_connection_type = kwargs.get('db_connection_type', None)
         self._records_before_commit = kwargs.get('records_before_commit', 1)
+        # on_conflict, 'do_nothing' or 'do_update', switches to bulk INSERT ... ON CONFLICT writes of up to
+        # records_before_commit records per transaction.
+        self._on_conflict = kwargs.get('on_conflict', None)
+        self._conflict_columns = kwargs.get('conflict_columns', None)
+        # wire_format 'tuple' queues each add_records() call as one list of tuples and always uses the bulk path.
+        self._wire_format = kwargs.get('wire_format', WIRE_FORMAT_ORM)
+        # Records are committed once records_before_commit have been added or the oldest uncommitted record is
+        # flush_interval_ms old, whichever comes first.
+        self._flush_interval = None
+        if kwargs.get('flush_interval_ms', None) is not None:
+            self._flush_interval = kwargs['flush_interval_ms'] / 1000.0
+        # 'block' or 'drop_oldest', what add_records does when a bounded queue is full.
+        self._queue_full_policy = kwargs.get('queue_full_policy', QUEUE_FULL_BLOCK)
+        self._dropped_records = 0
+        # Snapshots of the saver's counters are put on metrics_queue every metrics_interval seconds.
+        self._metrics_queue = kwargs.get('metrics_queue', None)
+        self._metrics_interval = kwargs.get('metrics_interval', 10.0)
+        # When db_connection_type is sqlite, the sqlite_profiles.SQLITE_PROFILES entry applied to the connection.
+        self._sqlite_profile = kwargs.get('sqlite_profile', None)
+        # spool_file, if provided, is a batch_spool.BatchSpool file uncommitted records are written to, so
+        # records_before_commit can be large without losing a batch if the process dies. Records left in it are
+        # written when the saver starts. spool_sync fsyncs each write to the spool.
+        self._spool_file = kwargs.get('spool_file', None)
+        self._spool_sync = kwargs.get('spool_sync', False)
+        # duplicate_filter_size, if provided, drops records whose (sensor_id, m_date) is among the last
+        # duplicate_filter_size keys seen before they reach the database. With seed_duplicate_filter the filter
+        # starts out with the keys of the newest rows in multi_obs.
+        self._duplicate_filter_size = kwargs.get('duplicate_filter_size', None)
+        self._seed_duplicate_filter = kwargs.get('seed_duplicate_filter', True)
+
+    @property
+    def data_queue(self):
+        return self._data_queue
+
+    @property
+    def dropped_records(self):
+        return self._dropped_records
 
     def add_records(self, records):
-        for rec in records:
-            self._data_queue.put(rec)
+        if self._wire_format == WIRE_FORMAT_TUPLE:
+            self._dropped_records += put_record(self._data_queue, [multi_obs_to_tuple(rec) for rec in records],
+                                                self._queue_full_policy)
+        else:
+            for rec in records:
+                self._dropped_records += put_record(self._data_queue, rec, self._queue_full_policy)
 
     def run(self):
+        # The ORM module is imported by the saver process, not by whoever imports the saver.
+        from .xeniaSQLAlchemy import xeniaAlchemy, multi_obs
         logger = None
         try:
             logger_name = self._logger_name
@@ -76,49 +123,26 @@ class MPDataSaverV2(Process):
 
             db = xeniaAlchemy()
             if (db.connectDB(self._db_connection_type, self._db_user, self._db_pwd, self._db_host, self._db_name,
-                             False)):
+                             False, self._sqlite_profile)):
                 logger.info(f"Successfully connect to DB: {self._db_name} at {self._db_host}")
             else:
                 logger.error(f"Unable to connect to DB: {self._db_name} at {self._db_host}. Terminating process.")
                 process_data = False
 
             start_time = time.time()
-            rec_count = 0
-            while process_data:
-                data_rec = self._data_queue.get()
-                if data_rec is not None:
-                    try:
-                        db.session.add(data_rec)
-                        if (rec_count % self._records_before_commit) == 0:
-                            db.session.commit()
-
-                        val = ""
-                        if data_rec.m_value is not None:
-                            val = "%f" % (data_rec.m_value)
-                        logger.debug(
-                            f"Adding record Sensor: {data_rec.sensor_id} Datetime: {data_rec.m_date} Value: {val}")
-
-                        if ((rec_count % 10) == 0):
-                            try:
-                                logger.debug(f"Approximate record count in DB queue: {self._data_queue.qsize()}")
-                            # We get this exception under OSX.
-                            except NotImplementedError:
-                                pass
-
-                            rec_count += 1
-                    # Trying to add record that already exists.
-                    except exc.IntegrityError as e:
-                        logger.error(f"Duplicate sensor id: {data_rec.sensor_id} Datetime: {data_rec.m_date}")
-                        db.session.rollback()
-                    except Exception as e:
-                        db.session.rollback()
-                        logger.exception(e)
-
-                else:
-                    process_data = False
-                    db.session.commit()
-
+            metrics = SaverMetrics(current_process().name, self._metrics_queue, self._metrics_interval)
+            if process_data:
+                MultiObsSaverLoop(db, multi_obs.__table__, self._data_queue, logger, metrics,
+                                  self._records_before_commit,
+                                  self._on_conflict is not None or self._wire_format == WIRE_FORMAT_TUPLE,
+                                  self._flush_interval, self._on_conflict, self._conflict_columns,
+                                  self._spool_file, self._spool_sync, self._duplicate_filter_size,
+                                  self._seed_duplicate_filter).run()
+            if db.session is not None:
                 db.disconnect()
-            logger.debug(f"{current_process().name} completed in {time.time() - start_time} seconds.")
+            metrics.publish(self._data_queue)
+            logger.debug(f"{current_process().name} completed in {time.time() - start_time} seconds. "
+                         f"Records written: {metrics.records_written} duplicates: {metrics.duplicates_skipped} "
+                         f"rollbacks: {metrics.rollbacks}")
         except Exception as e:
             logger.exception(e)
@@ -5,27 +5,81 @@ import time
 import traceback
 
 from multiprocessing import Process, Queue, current_process, Event
-from sqlalchemy import exc
-from .xeniaSQLiteAlchemy import xeniaAlchemy as sl_xeniaAlchemy
+from .multi_obs_writer import MultiObsSaverLoop, multi_obs_to_tuple, put_record, WIRE_FORMAT_ORM, \
+    WIRE_FORMAT_TUPLE, QUEUE_FULL_BLOCK
+from .saver_metrics import SaverMetrics
+from .shm_ring_buffer import ObsRingBuffer
 
 
 class SQLiteMPDataSaver(Process):
-    def __init__(self, db_filename, log_config_file, queue):
+    # batch_size, if provided, switches the saver to bulk mode: the queue is drained in chunks of up to batch_size
+    # records and each chunk is written with a single executemany insert inside one transaction. When it is None
+    # each record goes through the ORM session, committing every 10 records.
+    # wire_format WIRE_FORMAT_TUPLE queues each add_records() call as one list of tuples; it requires batch_size.
+    # queue can also be an ObsRingBuffer, a shared memory transport that also requires batch_size. Putting None on
+    # it, or calling close(), stops the saver like the None sentinel on a Queue.
+    # flush_interval_ms bounds how long a record waits to be committed: a batch is written once it has batch_size
+    # records or its first record is flush_interval_ms old, whichever comes first.
+    # If queue is None a Queue bounded to max_queue_size entries is created. When a bounded queue is full,
+    # queue_full_policy QUEUE_FULL_BLOCK makes add_records wait, QUEUE_FULL_DROP_OLDEST drops the oldest entry.
+    # Snapshots of the saver's counters are put on metrics_queue every metrics_interval seconds.
+    # sqlite_profile names the sqlite_profiles.SQLITE_PROFILES entry used for the saver's connection.
+    # spool_file, if provided, is a batch_spool.BatchSpool file uncommitted records are written to. Records left in
+    # it by a saver that died are written when the saver starts. spool_sync fsyncs each write to the spool.
+    # duplicate_filter_size, if provided, drops records whose (sensor_id, m_date) is among the last
+    # duplicate_filter_size keys seen before they reach the database, see duplicate_filter.DuplicateFilter. With
+    # seed_duplicate_filter the filter starts out with the keys of the newest rows in multi_obs.
+    def __init__(self, db_filename, log_config_file, queue=None, batch_size=None, wire_format=WIRE_FORMAT_ORM,
+                 flush_interval_ms=None, max_queue_size=0, queue_full_policy=QUEUE_FULL_BLOCK, metrics_queue=None,
+                 metrics_interval=10.0, sqlite_profile=None, spool_file=None, spool_sync=False,
+                 duplicate_filter_size=None, seed_duplicate_filter=True):
         Process.__init__(self)
+        if queue is None:
+            queue = Queue(maxsize=max_queue_size)
         self._data_queue = queue
         self._sqlite_file = db_filename
         self._log_config_file = log_config_file
         self._stop_event = Event()
+        self._batch_size = batch_size
+        if wire_format == WIRE_FORMAT_TUPLE and not batch_size:
+            raise ValueError("The tuple wire format requires a batch_size.")
+        if isinstance(queue, ObsRingBuffer) and not batch_size:
+            raise ValueError("The shared memory transport requires a batch_size.")
+        self._wire_format = wire_format
+        self._flush_interval = None
+        if flush_interval_ms is not None:
+            self._flush_interval = flush_interval_ms / 1000.0
+        self._queue_full_policy = queue_full_policy
+        self._dropped_records = 0
+        self._metrics_queue = metrics_queue
+        self._metrics_interval = metrics_interval
+        self._sqlite_profile = sqlite_profile
+        self._spool_file = spool_file
+        self._spool_sync = spool_sync
+        self._duplicate_filter_size = duplicate_filter_size
+        self._seed_duplicate_filter = seed_duplicate_filter
 
     @property
     def data_queue(self):
         return self._data_queue
 
+    @property
+    def dropped_records(self):
+        return self._dropped_records
+
     def add_records(self, records):
-        for rec in records:
-            self._data_queue.put(rec)
+        if isinstance(self._data_queue, ObsRingBuffer):
+            self._data_queue.put_many(records)
+        elif self._wire_format == WIRE_FORMAT_TUPLE:
+            self._dropped_records += put_record(self._data_queue, [multi_obs_to_tuple(rec) for rec in records],
+                                                self._queue_full_policy)
+        else:
+            for rec in records:
+                self._dropped_records += put_record(self._data_queue, rec, self._queue_full_policy)
 
     def run(self):
+        # The ORM module is imported by the saver process, not by whoever imports the saver.
+        from .xeniaSQLiteAlchemy import xeniaAlchemy as sl_xeniaAlchemy, multi_obs as sl_multi_obs
         logger = None
         try:
             logging.config.fileConfig(self._log_config_file)
@@ -35,7 +89,7 @@ class SQLiteMPDataSaver(Process):
             process_data = True
 
             db = sl_xeniaAlchemy()
-            if (db.connectDB('sqlite', None, None, self._sqlite_file, None, False) == True):
+            if db.connect_sqlite_db(self._sqlite_file, profile=self._sqlite_profile):
                 logger.info("Succesfully connect to DB: {db_file}".format(db_file=self._sqlite_file))
             else:
                 logger.error(
@@ -43,42 +97,19 @@ class SQLiteMPDataSaver(Process):
                 process_data = False
 
             start_time = time.time()
-            rec_count = 0
-            while process_data:
-                data_rec = self._data_queue.get()
-                if data_rec is not None:
-                    try:
-                        db.session.add(data_rec)
-                        if ((rec_count % 10) == 0):
-                            val = ""
-                            if data_rec.m_value is not None:
-                                val = "%f" % (data_rec.m_value)
-
-                            try:
-                                logger.info(
-                                    "Committing record Sensor: %d Datetime: %s Value: %s" % (
-                                    data_rec.sensor_id, data_rec.m_date, val))
-                                logger.info("Approximate record count in DB queue: %d" % (self._data_queue.qsize()))
-                                db.session.commit()
-                            # We get this exception under OSX.
-                            except NotImplementedError:
-                                pass
-                            except Exception as e:
-                                logger.exception(e)
-
-                    # Trying to add record that already exists.
-                    except exc.IntegrityError as e:
-                        # logger.error("Duplicate sensor id: %d Datetime: %s" % (data_rec.sensor_id, data_rec.m_date))
-                        db.session.rollback()
-                    except Exception as e:
-                        db.session.rollback()
-                        logger.exception(e)
-                else:
-                    process_data = False
-                rec_count += 1
-            db.session.commit()
-            db.disconnect()
-            logger.info("%s completed in %f seconds." % (current_process().name, time.time() - start_time))
+            metrics = SaverMetrics(current_process().name, self._metrics_queue, self._metrics_interval)
+            if process_data:
+                MultiObsSaverLoop(db, sl_multi_obs.__table__, self._data_queue, logger, metrics,
+                                  self._batch_size or 10, bool(self._batch_size), self._flush_interval,
+                                  spool_file=self._spool_file, spool_sync=self._spool_sync,
+                                  duplicate_filter_size=self._duplicate_filter_size,
+                                  seed_duplicate_filter=self._seed_duplicate_filter).run()
+            if db.session is not None:
+                db.disconnect()
+            metrics.publish(self._data_queue)
+            logger.info("%s completed in %f seconds. Records written: %d duplicates: %d rollbacks: %d" % (
+                current_process().name, time.time() - start_time, metrics.records_written,
+                metrics.duplicates_skipped, metrics.rollbacks))
         except Exception as e:
             if logger is not None:
                 logger.exception(e)
@@ -0,0 +1,108 @@
+import logging
+import time
+from queue import Queue
+from threading import Thread
+
+from .multi_obs_writer import MultiObsSaverLoop, multi_obs_to_tuple, put_record, WIRE_FORMAT_ORM, \
+    WIRE_FORMAT_TUPLE, QUEUE_FULL_BLOCK
+from .saver_metrics import SaverMetrics
+
+
+class ThreadDataSaver(Thread):
+    """
+    Function: __init__
+    Purpose: Drop in replacement for MPDataSaverV2 that runs the saver in a thread of the calling process. The write
+    path is I/O bound, so for small deployments and tests this avoids starting a process and pickling every record
+    across to it. initialize(), add_records() and the None stop sentinel work the same way as in MPDataSaverV2,
+    data_queue is a queue.Queue instead of a multiprocessing.Queue.
+    """
+
+    def __init__(self):
+        Thread.__init__(self)
+        self._logger_name = ''
+        self._data_queue = None
+        self._db_user = None
+        self._db_pwd = None
+        self._db_host = None
+        self._db_name = None
+        self._db_connection_type = None
+
+    def initialize(self, **kwargs):
+        # Takes the same options as MPDataSaverV2.initialize(). log_config is not used, the thread logs through
+        # logger_name with the process's logging configuration.
+        self._logger_name = kwargs.get('logger_name', 'data_saver_logger')
+        self._data_queue = kwargs.get('data_queue', None)
+        if self._data_queue is None:
+            self._data_queue = Queue(maxsize=kwargs.get('max_queue_size', 0))
+        self._db_user = kwargs.get('db_user', None)
+        self._db_pwd = kwargs.get('db_pwd', None)
+        self._db_host = kwargs.get('db_host', None)
+        self._db_name = kwargs.get('db_name', None)
+        self._db_connection_type = kwargs.get('db_connection_type', None)
+        self._records_before_commit = kwargs.get('records_before_commit', 1)
+        self._on_conflict = kwargs.get('on_conflict', None)
+        self._conflict_columns = kwargs.get('conflict_columns', None)
+        self._wire_format = kwargs.get('wire_format', WIRE_FORMAT_ORM)
+        self._flush_interval = None
+        if kwargs.get('flush_interval_ms', None) is not None:
+            self._flush_interval = kwargs['flush_interval_ms'] / 1000.0
+        self._queue_full_policy = kwargs.get('queue_full_policy', QUEUE_FULL_BLOCK)
+        self._dropped_records = 0
+        self._metrics_queue = kwargs.get('metrics_queue', None)
+        self._metrics_interval = kwargs.get('metrics_interval', 10.0)
+        self._sqlite_profile = kwargs.get('sqlite_profile', None)
+        self._spool_file = kwargs.get('spool_file', None)
+        self._spool_sync = kwargs.get('spool_sync', False)
+        self._duplicate_filter_size = kwargs.get('duplicate_filter_size', None)
+        self._seed_duplicate_filter = kwargs.get('seed_duplicate_filter', True)
+
+    @property
+    def data_queue(self):
+        return self._data_queue
+
+    @property
+    def dropped_records(self):
+        return self._dropped_records
+
+    def add_records(self, records):
+        if self._wire_format == WIRE_FORMAT_TUPLE:
+            self._dropped_records += put_record(self._data_queue, [multi_obs_to_tuple(rec) for rec in records],
+                                                self._queue_full_policy)
+        else:
+            for rec in records:
+                self._dropped_records += put_record(self._data_queue, rec, self._queue_full_policy)
+
+    def run(self):
+        # The ORM module is imported when the thread starts, not by whoever imports the saver.
+        from .xeniaSQLAlchemy import xeniaAlchemy, multi_obs
+        logger = logging.getLogger(self._logger_name)
+        try:
+            logger.debug(f"{self.name} starting run.")
+
+            process_data = True
+
+            db = xeniaAlchemy()
+            if (db.connectDB(self._db_connection_type, self._db_user, self._db_pwd, self._db_host, self._db_name,
+                             False, self._sqlite_profile)):
+                logger.info(f"Successfully connect to DB: {self._db_name} at {self._db_host}")
+            else:
+                logger.error(f"Unable to connect to DB: {self._db_name} at {self._db_host}. Terminating thread.")
+                process_data = False
+
+            start_time = time.time()
+            metrics = SaverMetrics(self.name, self._metrics_queue, self._metrics_interval)
+            if process_data:
+                MultiObsSaverLoop(db, multi_obs.__table__, self._data_queue, logger, metrics,
+                                  self._records_before_commit,
+                                  self._on_conflict is not None or self._wire_format == WIRE_FORMAT_TUPLE,
+                                  self._flush_interval, self._on_conflict, self._conflict_columns,
+                                  self._spool_file, self._spool_sync, self._duplicate_filter_size,
+                                  self._seed_duplicate_filter).run()
+            if db.session is not None:
+                db.disconnect()
+            metrics.publish(self._data_queue)
+            logger.debug(f"{self.name} completed in {time.time() - start_time} seconds. "
+                         f"Records written: {metrics.records_written} duplicates: {metrics.duplicates_skipped} "
+                         f"rollbacks: {metrics.rollbacks}")
+        except Exception as e:
+            logger.exception(e)
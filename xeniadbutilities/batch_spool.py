@@ -0,0 +1,102 @@
+import os
+import pickle
+import struct
+import zlib
+
+from .multi_obs_writer import multi_obs_to_tuple
+
+# Each frame is the payload length and its crc32 followed by a pickled list of record tuples.
+_FRAME_HEADER = struct.Struct('<II')
+
+
+class BatchSpool:
+    """
+    Function: __init__
+    Purpose: Append only file the savers write each batch to before committing it and truncate once the commit is
+    done. If the saver process dies with a batch in flight, the batch is still in the spool and is replayed the next
+    time a saver opens it.
+    Parameters:
+      filename is the spool file, created if it does not exist. Each saver needs its own file.
+      sync, if True, fsyncs every append so a batch also survives the machine going down, not just the process.
+    """
+
+    def __init__(self, filename, sync=False):
+        self._filename = filename
+        self._sync = sync
+        self._file = open(filename, 'a+b')
+
+    @property
+    def filename(self):
+        return self._filename
+
+    """
+    Function: append
+    Purpose: Writes the records to the end of the spool as one frame.
+    Parameters:
+      records is a list of multi_obs objects or tuples in multi_obs_writer.MULTI_OBS_COLUMNS order.
+    """
+
+    def append(self, records):
+        if not records:
+            return
+        payload = pickle.dumps([multi_obs_to_tuple(rec) for rec in records], pickle.HIGHEST_PROTOCOL)
+        self._file.write(_FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._file.flush()
+        if self._sync:
+            os.fsync(self._file.fileno())
+
+    """
+    Function: replay
+    Purpose: Reads back the records left in the spool. A frame cut short or corrupted by a crash mid write ends the
+    replay, everything before it is returned.
+    Returns:
+      A list of record tuples in the order they were appended.
+    """
+
+    def replay(self):
+        records = []
+        self._file.seek(0)
+        while True:
+            header = self._file.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                break
+            payload_len, crc = _FRAME_HEADER.unpack(header)
+            payload = self._file.read(payload_len)
+            if len(payload) < payload_len or zlib.crc32(payload) != crc:
+                break
+            records.extend(pickle.loads(payload))
+        self._file.seek(0, os.SEEK_END)
+        return records
+
+    def truncate(self):
+        self._file.seek(0)
+        self._file.truncate()
+        if self._sync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+"""
+Function: replay_spool
+Purpose: Writes any records a previous run of the saver left in the spool, then empties it. Called before the
+saver starts pulling records off its queue.
+Parameters:
+  spool is the BatchSpool.
+  writer is the multi_obs_writer.MultiObsBatchWriter used to write the records. Records the previous run did get
+    to commit are handled as duplicates by the writer.
+  logger is used to report the replay.
+Returns:
+  The number of records inserted.
+"""
+
+
+def replay_spool(spool, writer, logger):
+    records = spool.replay()
+    inserted = 0
+    if records:
+        logger.info("Replaying %d records from spool %s." % (len(records), spool.filename))
+        inserted = writer.write(records)
+    spool.truncate()
+    return inserted
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+from .multi_obs_writer import SENSOR_ID_NDX, M_DATE_NDX
+
+
+def record_key(rec):
+    if type(rec) is tuple:
+        return rec[SENSOR_ID_NDX], rec[M_DATE_NDX]
+    return rec.sensor_id, rec.m_date
+
+
+class DuplicateFilter:
+    """
+    Function: __init__
+    Purpose: Bounded LRU set of the (sensor_id, m_date) keys a saver has already seen. Records whose key is in the
+    set are dropped before any SQL is run, so re-polled feeds resending the same observations do not each cost an
+    insert and an IntegrityError rollback. Keys are compared as they are, so m_date must be in the same form the
+    producers and the database use.
+    A key only joins the set once its record is committed. Until commit() is called the keys of the records that
+    passed the filter are pending: repeats of them are still dropped, but rollback() forgets them so a record whose
+    commit failed is let through when it is sent again.
+    Parameters:
+      capacity is the most keys remembered. The least recently seen key is forgotten first.
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1.")
+        self._capacity = capacity
+        self._keys = OrderedDict()
+        self._pending = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _remember(self, key):
+        self._keys[key] = None
+        if len(self._keys) > self._capacity:
+            self._keys.popitem(last=False)
+
+    """
+    Function: seed
+    Purpose: Loads the keys of the most recently inserted multi_obs rows, so duplicates are caught from the first
+    batch after the saver starts.
+    Parameters:
+      db is the connected xeniaAlchemy object.
+      table is the multi_obs Table object.
+    Returns:
+      The number of keys loaded.
+    """
+
+    def seed(self, db, table):
+        from sqlalchemy import select
+        stmt = select(table.c.sensor_id, table.c.m_date).order_by(table.c.row_id.desc()).limit(self._capacity)
+        with db.dbEngine.connect() as connection:
+            rows = connection.execute(stmt).all()
+        # Oldest first so the newest rows end up the most recently used.
+        for sensor_id, m_date in reversed(rows):
+            self._remember((sensor_id, m_date))
+        return len(rows)
+
+    def seen(self, rec):
+        key = record_key(rec)
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            self.hits += 1
+            return True
+        if key in self._pending:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self._pending[key] = None
+        return False
+
+    """
+    Function: filter
+    Purpose: Drops the records already seen, including repeats within records.
+    Parameters:
+      records is a list of multi_obs objects or tuples in multi_obs_writer.MULTI_OBS_COLUMNS order.
+    Returns:
+      The list of records not seen before.
+    """
+
+    def filter(self, records):
+        return [rec for rec in records if not self.seen(rec)]
+
+    def commit(self):
+        for key in self._pending:
+            self._remember(key)
+        self._pending.clear()
+
+    def rollback(self):
+        self._pending.clear()
+
+    def remember(self, records):
+        for rec in records:
+            self._remember(record_key(rec))
+
+    def clear(self):
+        self._keys.clear()
+        self._pending.clear()
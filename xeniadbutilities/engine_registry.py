@@ -0,0 +1,116 @@
+import os
+import threading
+
+from sqlalchemy import create_engine, event
+
+from .sqlite_profiles import apply_sqlite_profile
+
+
+class EngineRegistry:
+    """
+    Function: __init__
+    Purpose: Hands out one shared SQLAlchemy engine per connection string, so every xeniaAlchemy object in a process
+    uses the same connection pool and the dialect is only initialized once. Engines are keyed on the connection
+    string and the options they were built with.
+    After a fork the child drops the engines it inherited without closing their connections, which still belong to
+    the parent, and builds new ones on the next get_engine(). Engines already handed out in the parent are reset so
+    they open fresh connections in the child.
+    Parameters:
+      pool_size, max_overflow and pool_pre_ping are the defaults for engines that do not pass their own. None leaves
+        SQLAlchemy's default.
+    """
+
+    def __init__(self, pool_size=None, max_overflow=None, pool_pre_ping=False):
+        self._pool_size = pool_size
+        self._max_overflow = max_overflow
+        self._pool_pre_ping = pool_pre_ping
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._pid = os.getpid()
+
+    def __len__(self):
+        return len(self._engines)
+
+    """
+    Function: get_engine
+    Purpose: Returns the shared engine for the connection string, creating it on first use.
+    Parameters:
+      connection_string is the SQLAlchemy URL.
+      echo, if True, logs the SQL.
+      sqlite_profile is the name of a sqlite_profiles.SQLITE_PROFILES entry applied to every SQLite connection.
+      pool_size, max_overflow and pool_pre_ping override the registry defaults. The pool sizes are ignored for
+        in-memory SQLite databases, which do not use a sized pool.
+    Returns:
+      The engine.
+    """
+
+    def get_engine(self, connection_string, echo=False, sqlite_profile=None, pool_size=None, max_overflow=None,
+                   pool_pre_ping=None):
+        if pool_size is None:
+            pool_size = self._pool_size
+        if max_overflow is None:
+            max_overflow = self._max_overflow
+        if pool_pre_ping is None:
+            pool_pre_ping = self._pool_pre_ping
+        key = (connection_string, echo, sqlite_profile, pool_size, max_overflow, pool_pre_ping)
+
+        with self._lock:
+            if os.getpid() != self._pid:
+                self._reset_after_fork()
+            engine = self._engines.get(key)
+            if engine is None:
+                engine_args = {'echo': echo, 'pool_pre_ping': pool_pre_ping}
+                if not _is_memory_sqlite(connection_string):
+                    if pool_size is not None:
+                        engine_args['pool_size'] = pool_size
+                    if max_overflow is not None:
+                        engine_args['max_overflow'] = max_overflow
+                engine = create_engine(connection_string, **engine_args)
+                if sqlite_profile is not None and engine.dialect.name == 'sqlite':
+                    event.listen(engine, 'connect',
+                                 lambda dbapi_connection, connection_record: apply_sqlite_profile(dbapi_connection,
+                                                                                                  sqlite_profile))
+                self._engines[key] = engine
+            return engine
+
+    """
+    Function: dispose
+    Purpose: Closes the pooled connections of every engine and empties the registry. Engines already handed out keep
+    working, they reconnect on their next use.
+    """
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+    def _reset_after_fork(self):
+        # The parent's sockets and file handles must not be closed or used by the child.
+        for engine in self._engines.values():
+            engine.dispose(close=False)
+        self._engines.clear()
+        self._pid = os.getpid()
+
+    def after_fork(self):
+        # The lock may have been held by another thread of the parent when it forked.
+        self._lock = threading.Lock()
+        self._reset_after_fork()
+
+
+def _is_memory_sqlite(connection_string):
+    return connection_string.startswith('sqlite') and connection_string.rstrip('/').endswith((':memory:', 'sqlite:'))
+
+
+engine_registry = EngineRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=engine_registry.after_fork)
+
+
+def get_engine(connection_string, **kwargs):
+    return engine_registry.get_engine(connection_string, **kwargs)
+
+
+def dispose_engines():
+    engine_registry.dispose()
@@ -0,0 +1,93 @@
+from sqlalchemy import select, bindparam
+
+# Built once per models module, see lookup_statements().
+_statements = {}
+
+
+"""
+Function: lookup_statements
+Purpose: Returns the parameterized SELECTs behind the xeniaAlchemy *Exists methods. Each statement is built once per
+process, so a lookup only binds its parameters and SQLAlchemy finds the compiled form in the engine's compiled cache,
+instead of building and compiling a new query chain every call.
+Parameters:
+  models is the module with the ORM classes for the backend, xeniaSQLAlchemy or xeniaSQLiteAlchemy.
+Returns:
+  A dictionary of lookup name: statement. The bound parameter names are listed next to each statement.
+"""
+
+
+def lookup_statements(models):
+    statements = _statements.get(models.__name__)
+    if statements is None:
+        statements = _build_statements(models)
+        _statements[models.__name__] = statements
+    return statements
+
+
+def _build_statements(models):
+    platform = models.platform
+    organization = models.organization
+    platform_type = models.platform_type
+    sensor = models.sensor
+    m_type = models.m_type
+    m_scalar_type = models.m_scalar_type
+    obs_type = models.obs_type
+    uom_type = models.uom_type
+
+    m_type_join = select(m_type.row_id) \
+        .join(m_scalar_type, m_scalar_type.row_id == m_type.m_scalar_type_id) \
+        .join(obs_type, obs_type.row_id == m_scalar_type.obs_type_id) \
+        .join(uom_type, uom_type.row_id == m_scalar_type.uom_type_id)
+
+    return {
+        # platform_handle
+        'platform': select(platform.row_id).where(platform.platform_handle == bindparam('platform_handle')),
+        # short_name
+        'organization': select(organization.row_id).where(organization.short_name == bindparam('short_name')),
+        # type_name
+        'platform_type': select(platform_type.row_id).where(platform_type.type_name == bindparam('type_name')),
+        # obs_name, uom, platform_handle, s_order
+        'sensor': select(sensor.row_id)
+        .join(platform, platform.row_id == sensor.platform_id)
+        .join(m_type, m_type.row_id == sensor.m_type_id)
+        .join(m_scalar_type, m_scalar_type.row_id == m_type.m_scalar_type_id)
+        .join(obs_type, obs_type.row_id == m_scalar_type.obs_type_id)
+        .join(uom_type, uom_type.row_id == m_scalar_type.uom_type_id)
+        .where(sensor.s_order == bindparam('s_order'))
+        .where(platform.platform_handle == bindparam('platform_handle'))
+        .where(obs_type.standard_name == bindparam('obs_name'))
+        .where(uom_type.standard_name == bindparam('uom')),
+        # obs_name, uom
+        'm_type': m_type_join
+        .where(obs_type.standard_name == bindparam('obs_name'))
+        .where(uom_type.standard_name == bindparam('uom')),
+        # obs_name
+        'obs_type': select(obs_type.row_id).where(obs_type.standard_name == bindparam('obs_name')),
+        # uom
+        'uom_type': select(uom_type.row_id).where(uom_type.standard_name == bindparam('uom')),
+        # obs_type_id, uom_type_id
+        'scalar_type': select(m_scalar_type.row_id)
+        .where(m_scalar_type.obs_type_id == bindparam('obs_type_id'))
+        .where(m_scalar_type.uom_type_id == bindparam('uom_type_id')),
+    }
+
+
+"""
+Function: execute_lookup
+Purpose: Runs one of the lookup statements on the session's connection, so it sees the session's pending transaction,
+without going through the ORM query layer.
+Parameters:
+  session is the xeniaAlchemy session.
+  stmt is the statement from lookup_statements().
+  params is the dictionary of bound parameters.
+Returns:
+  The row, with a row_id attribute like the Query.one() result it replaces. Raises NoResultFound when there is no
+  match and MultipleResultsFound when there is more than one, the same as Query.one().
+"""
+
+
+def execute_lookup(session, stmt, params):
+    # Query.one() flushes pending objects first, so a record added without a commit is still found.
+    if session.autoflush:
+        session.flush()
+    return session.connection().execute(stmt, params).one()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+CACHE_VERSION = 2
+
+
+"""
+Function: db_fingerprint
+Purpose: Identifies the database a mapping was resolved against, without connecting to it. The password is left out
+so it never ends up in the cache file.
+Parameters:
+  drivername, user, host and database are the parts of the connection URL. SQLite file names are made absolute.
+Returns:
+  The fingerprint string.
+"""
+
+
+def db_fingerprint(drivername, user, host, database):
+    if drivername.startswith('sqlite') and database:
+        database = os.path.abspath(database)
+    return "%s://%s@%s/%s" % (drivername, user or '', host or '', database or '')
+
+
+def engine_fingerprint(engine):
+    url = engine.url
+    return db_fingerprint(url.drivername, url.username, url.host, url.database)
+
+
+"""
+Function: state_digest
+Purpose: Shortens a metadata fingerprint, see xeniaAlchemy.metadata_fingerprint, to something that can be part of a
+cache key.
+Parameters:
+  state is the tuple of values.
+Returns:
+  The hex digest.
+"""
+
+
+def state_digest(state):
+    return hashlib.sha256(repr(tuple(state)).encode('utf-8')).hexdigest()[:16]
+
+
+"""
+Function: mapping_hash
+Purpose: Hashes the parts of a json_obs_map the resolved ids depend on, the target obs, uom and s_order of each
+mapped observation, so an edited mapping file does not pick up ids resolved for its old contents.
+Parameters:
+  sensor_keys is the (obs, uom, platform_handle, s_order) list from json_obs_map.sensor_keys().
+Returns:
+  The hex digest.
+"""
+
+
+def mapping_hash(sensor_keys):
+    return hashlib.sha256(json.dumps([list(key) for key in sensor_keys]).encode('utf-8')).hexdigest()
+
+
+class MappingCache:
+    """
+    Function: __init__
+    Purpose: Sidecar JSON file with the sensor_id and m_type_id resolved for each platform's obs mapping, so a short
+    lived ingest job can set up its mappings without resolving each sensor. An entry is only used when the platform,
+    the mapping hash and the database fingerprint all match. The fingerprint includes the state of the metadata
+    tables, so adding, removing or changing a sensor or platform makes the entries stale. Only platforms whose sensors
+    all resolved are stored.
+    Parameters:
+      file_name is the cache file. It does not need to exist yet.
+      max_age, if provided, is the number of seconds an entry is trusted before it is resolved from the database again.
+    """
+
+    def __init__(self, file_name, max_age=None):
+        self.logger = logging.getLogger(type(self).__name__)
+        self._file_name = file_name
+        self._max_age = max_age
+        self._entries = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        self._entries = {}
+        try:
+            with open(self._file_name, "r") as cache_file:
+                cache_json = json.load(cache_file)
+            if cache_json.get('version') == CACHE_VERSION:
+                self._entries = cache_json.get('entries', {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            # A corrupt or unreadable cache is only a lost optimization.
+            self.logger.error("Ignoring mapping cache: %s. %s" % (self._file_name, e))
+
+    def _entry_key(self, platform_handle, mapping_digest, fingerprint):
+        return "%s|%s|%s" % (fingerprint, platform_handle, mapping_digest)
+
+    """
+    Function: get
+    Purpose: Looks up the ids resolved for a platform's mapping.
+    Parameters:
+      platform_handle is the platform.
+      sensor_keys is the (obs, uom, platform_handle, s_order) list of the mapping.
+      fingerprint identifies the database and the state of its metadata tables, see
+        xenia_obs_map.mapping_db_fingerprint.
+    Returns:
+      A dictionary of key: (sensor_id, m_type_id) or None if there is no usable entry.
+    """
+
+    def get(self, platform_handle, sensor_keys, fingerprint):
+        entry = self._entries.get(self._entry_key(platform_handle, mapping_hash(sensor_keys), fingerprint))
+        if entry is None or (self._max_age is not None and time.time() - entry['created'] > self._max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {(obs_name, uom, platform_handle, s_order): (sensor_id, m_type_id)
+                for obs_name, uom, s_order, sensor_id, m_type_id in entry['sensors']}
+
+    def put(self, platform_handle, sensor_keys, fingerprint, resolved):
+        self._entries[self._entry_key(platform_handle, mapping_hash(sensor_keys), fingerprint)] = {
+            'created': time.time(),
+            'sensors': [[obs_name, uom, s_order] + list(resolved[(obs_name, uom, platform_handle, s_order)])
+                        for obs_name, uom, platform_handle, s_order in sensor_keys]
+        }
+        self._dirty = True
+
+    def invalidate(self):
+        self._entries = {}
+        self._dirty = True
+
+    """
+    Function: save
+    Purpose: Writes the cache if it changed. The file is written to a temporary file and renamed over the old one so a
+    job reading it at the same time never sees a partial file.
+    """
+
+    def save(self):
+        if not self._dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self._file_name))
+        fd, tmp_name = tempfile.mkstemp(dir=directory, prefix='.mapping_cache')
+        try:
+            with os.fdopen(fd, "w") as cache_file:
+                json.dump({'version': CACHE_VERSION, 'entries': self._entries}, cache_file)
+            os.replace(tmp_name, self._file_name)
+        except Exception:
+            os.unlink(tmp_name)
+            raise
+        self._dirty = False
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
@@ -0,0 +1,211 @@
+import time
+
+from sqlalchemy import select, func
+
+
+"""
+Function: metadata_fingerprint
+Purpose: Cheap signal of whether the metadata tables changed: the max row_id, row count and, where the table has one,
+max row_update_date of organization, platform, sensor, m_type, m_scalar_type, obs_type and uom_type. One statement, no
+rows are loaded.
+Parameters:
+  connection is an open SQLAlchemy connection.
+  models is the module with the ORM classes for the backend, xeniaSQLAlchemy or xeniaSQLiteAlchemy.
+Returns:
+  A tuple of the values. Two tuples compare equal when no table changed in between.
+"""
+
+
+def metadata_fingerprint(connection, models):
+    columns = []
+    for table in (models.organization, models.platform, models.sensor, models.m_type, models.m_scalar_type,
+                  models.obs_type, models.uom_type):
+        columns.append(select(func.max(table.row_id)).scalar_subquery())
+        columns.append(select(func.count(table.row_id)).scalar_subquery())
+        if hasattr(table, 'row_update_date'):
+            columns.append(select(func.max(table.row_update_date)).scalar_subquery())
+    return tuple(connection.execute(select(*columns)).one())
+
+
+class MetadataCatalog:
+    """
+    Function: __init__
+    Purpose: In memory copy of the xenia metadata tables: organization, platform, sensor, m_type, m_scalar_type,
+    obs_type and uom_type. They are loaded with one connection when the catalog is built and the *Exists lookups of
+    xeniaAlchemy are answered from dictionaries instead of a query each. Lookups for rows that are not in the catalog
+    return what the xeniaAlchemy lookups return for a missing row: -1 for obsTypeExists, uomTypeExists and
+    scalarTypeExists, None for the others. Rows added through xeniaAlchemy.addRec are added to the catalog with
+    add_rec().
+    Parameters:
+      db is the connected xeniaAlchemy object.
+      models is the module with the ORM classes for the backend, xeniaSQLAlchemy or xeniaSQLiteAlchemy.
+      check_interval, if provided, is the number of seconds a lookup trusts the catalog before it checks whether the
+        tables have changed, see refresh_if_changed().
+    """
+
+    def __init__(self, db, models, check_interval=None):
+        self._db = db
+        self._models = models
+        self._check_interval = check_interval
+        self._fingerprint = None
+        self._last_check = None
+        self.refresh()
+
+    """
+    Function: refresh
+    Purpose: Reloads every metadata table and rebuilds the indexes.
+    """
+
+    def refresh(self):
+        models = self._models
+        with self._db.dbEngine.connect() as connection:
+            fingerprint = metadata_fingerprint(connection, models)
+            organizations = connection.execute(select(models.organization.row_id,
+                                                      models.organization.short_name)).all()
+            platforms = connection.execute(select(models.platform.row_id, models.platform.platform_handle)).all()
+            obs_types = connection.execute(select(models.obs_type.row_id, models.obs_type.standard_name)).all()
+            uom_types = connection.execute(select(models.uom_type.row_id, models.uom_type.standard_name)).all()
+            scalar_types = connection.execute(select(models.m_scalar_type.row_id,
+                                                     models.m_scalar_type.obs_type_id,
+                                                     models.m_scalar_type.uom_type_id)).all()
+            m_types = connection.execute(select(models.m_type.row_id, models.m_type.m_scalar_type_id)
+                                         .order_by(models.m_type.row_id)).all()
+            sensors = connection.execute(select(models.sensor.row_id, models.sensor.platform_id,
+                                                models.sensor.m_type_id, models.sensor.s_order)).all()
+
+        self._organizations = {}
+        self._platforms = {}
+        self._obs_types = {}
+        self._uom_types = {}
+        self._scalar_types = {}
+        self._m_types = {}
+        self._sensors = {}
+        # Reverse indexes used to key m_types and sensors on names.
+        self._platform_handles = {}
+        self._obs_names = {}
+        self._uom_names = {}
+        self._scalar_names = {}
+        self._m_type_names = {}
+        for row_id, short_name in organizations:
+            self._add_organization(row_id, short_name)
+        for row_id, platform_handle in platforms:
+            self._add_platform(row_id, platform_handle)
+        for row_id, standard_name in obs_types:
+            self._add_obs_type(row_id, standard_name)
+        for row_id, standard_name in uom_types:
+            self._add_uom_type(row_id, standard_name)
+        for row_id, obs_type_id, uom_type_id in scalar_types:
+            self._add_scalar_type(row_id, obs_type_id, uom_type_id)
+        for row_id, scalar_id in m_types:
+            self._add_m_type(row_id, scalar_id)
+        for row_id, platform_id, m_type_id, s_order in sensors:
+            self._add_sensor(row_id, platform_id, m_type_id, s_order)
+
+        self._fingerprint = fingerprint
+        self._last_check = time.monotonic()
+
+    def _add_organization(self, row_id, short_name):
+        self._organizations[short_name] = row_id
+
+    def _add_platform(self, row_id, platform_handle):
+        self._platforms[platform_handle] = row_id
+        self._platform_handles[row_id] = platform_handle
+
+    def _add_obs_type(self, row_id, standard_name):
+        self._obs_types[standard_name] = row_id
+        self._obs_names[row_id] = standard_name
+
+    def _add_uom_type(self, row_id, standard_name):
+        self._uom_types[standard_name] = row_id
+        self._uom_names[row_id] = standard_name
+
+    def _add_scalar_type(self, row_id, obs_type_id, uom_type_id):
+        self._scalar_types[(obs_type_id, uom_type_id)] = row_id
+        self._scalar_names[row_id] = (self._obs_names.get(obs_type_id), self._uom_names.get(uom_type_id))
+
+    def _add_m_type(self, row_id, scalar_id):
+        names = self._scalar_names.get(scalar_id)
+        self._m_type_names[row_id] = names
+        # The lowest row_id wins when more than one m_type uses the scalar type.
+        if names is not None and (names not in self._m_types or row_id < self._m_types[names]):
+            self._m_types[names] = row_id
+
+    def _add_sensor(self, row_id, platform_id, m_type_id, s_order):
+        names = self._m_type_names.get(m_type_id)
+        if names is not None and platform_id in self._platform_handles:
+            self._sensors[(names[0], names[1], self._platform_handles[platform_id], s_order)] = row_id
+
+    """
+    Function: add_rec
+    Purpose: Adds a row that was just committed to the indexes, so it is found without reloading the catalog.
+    Parameters:
+      rec is the committed ORM object. Objects of other tables are ignored.
+    """
+
+    def add_rec(self, rec):
+        models = self._models
+        if isinstance(rec, models.organization):
+            self._add_organization(rec.row_id, rec.short_name)
+        elif isinstance(rec, models.platform):
+            self._add_platform(rec.row_id, rec.platform_handle)
+        elif isinstance(rec, models.obs_type):
+            self._add_obs_type(rec.row_id, rec.standard_name)
+        elif isinstance(rec, models.uom_type):
+            self._add_uom_type(rec.row_id, rec.standard_name)
+        elif isinstance(rec, models.m_scalar_type):
+            self._add_scalar_type(rec.row_id, rec.obs_type_id, rec.uom_type_id)
+        elif isinstance(rec, models.m_type):
+            self._add_m_type(rec.row_id, rec.m_scalar_type_id)
+        elif isinstance(rec, models.sensor):
+            self._add_sensor(rec.row_id, rec.platform_id, rec.m_type_id, rec.s_order)
+
+    """
+    Function: has_changed
+    Purpose: Compares the metadata_fingerprint of the tables with the one taken when the catalog was loaded.
+    Returns:
+      True if any table changed since the catalog was loaded.
+    """
+
+    def has_changed(self):
+        with self._db.dbEngine.connect() as connection:
+            fingerprint = metadata_fingerprint(connection, self._models)
+        self._last_check = time.monotonic()
+        return fingerprint != self._fingerprint
+
+    def refresh_if_changed(self):
+        if self.has_changed():
+            self.refresh()
+            return True
+        return False
+
+    def _check(self):
+        if self._check_interval is not None and (time.monotonic() - self._last_check) >= self._check_interval:
+            self.refresh_if_changed()
+
+    def organizationExists(self, organizationName):
+        self._check()
+        return self._organizations.get(organizationName)
+
+    def platformExists(self, platformHandle):
+        self._check()
+        return self._platforms.get(platformHandle)
+
+    def obsTypeExists(self, obsName):
+        self._check()
+        return self._obs_types.get(obsName, -1)
+
+    def uomTypeExists(self, uomName):
+        self._check()
+        return self._uom_types.get(uomName, -1)
+
+    def scalarTypeExists(self, obsTypeID, uomTypeID):
+        self._check()
+        return self._scalar_types.get((obsTypeID, uomTypeID), -1)
+
+    def mTypeExists(self, obsName, uom):
+        self._check()
+        return self._m_types.get((obsName, uom))
+
+    def sensorExists(self, obsName, uom, platformHandle, sOrder=1):
+        self._check()
+        return self._sensors.get((obsName, uom, platformHandle, sOrder))
@@ -0,0 +1,525 @@
+import logging
+import time
+from operator import itemgetter
+from queue import Empty, Full
+
+# sqlalchemy is imported where it is used so the parent side of the savers, which only queues records, and
+# json_obs_map do not pay for it at import time.
+
+# Column order used when a multi_obs record is turned into insert parameters. row_id is left out so the
+# database assigns it. the_geom is only a column of the PostgreSQL model, records of the SQLite model carry None for
+# it and it is left out of inserts into a table without it, see multi_obs_columns().
+MULTI_OBS_COLUMNS = (
+    'row_entry_date',
+    'row_update_date',
+    'platform_handle',
+    'sensor_id',
+    'm_type_id',
+    'm_date',
+    'm_lon',
+    'm_lat',
+    'm_z',
+    'm_value',
+    'm_value_2',
+    'm_value_3',
+    'm_value_4',
+    'm_value_5',
+    'm_value_6',
+    'm_value_7',
+    'm_value_8',
+    'qc_metadata_id',
+    'qc_level',
+    'qc_flag',
+    'qc_metadata_id_2',
+    'qc_level_2',
+    'qc_flag_2',
+    'metadata_id',
+    'd_label_theta',
+    'd_top_of_hour',
+    'd_report_hour',
+    'the_geom',
+)
+
+
+ON_CONFLICT_DO_NOTHING = 'do_nothing'
+ON_CONFLICT_DO_UPDATE = 'do_update'
+# Wire formats for records put on a saver queue. "orm" queues multi_obs objects one at a time. "tuple" queues
+# each add_records() call as a single list of plain tuples in MULTI_OBS_COLUMNS order, which is far cheaper to
+# pickle than ORM instances.
+WIRE_FORMAT_ORM = 'orm'
+WIRE_FORMAT_TUPLE = 'tuple'
+SENSOR_ID_NDX = MULTI_OBS_COLUMNS.index('sensor_id')
+M_DATE_NDX = MULTI_OBS_COLUMNS.index('m_date')
+
+# What add_records does when a bounded queue is full. "block" waits for the saver to make room, "drop_oldest"
+# throws away the oldest queued entry to make room for the new one.
+QUEUE_FULL_BLOCK = 'block'
+QUEUE_FULL_DROP_OLDEST = 'drop_oldest'
+
+# The columns ON CONFLICT DO UPDATE targets. The database needs a unique index over them.
+DEFAULT_CONFLICT_COLUMNS = ('sensor_id', 'm_date')
+
+
+# itemgetters that pull a column subset out of a tuple record, keyed on the column subset.
+_TUPLE_GETTERS = {}
+
+
+def multi_obs_to_tuple(rec):
+    if type(rec) is tuple:
+        return rec
+    return tuple([getattr(rec, name, None) for name in MULTI_OBS_COLUMNS])
+
+
+"""
+Function: multi_obs_columns
+Purpose: The MULTI_OBS_COLUMNS the table has, in MULTI_OBS_COLUMNS order.
+Parameters:
+  table is the multi_obs Table object.
+Returns:
+  A tuple of the column names.
+"""
+
+
+def multi_obs_columns(table):
+    return tuple(name for name in MULTI_OBS_COLUMNS if name in table.c)
+
+
+"""
+Function: multi_obs_params
+Purpose: Turns a record into the parameter dictionary of an insert.
+Parameters:
+  rec is a multi_obs object or a tuple in MULTI_OBS_COLUMNS order.
+  columns are the columns to include, from multi_obs_columns() of the table the record is inserted into.
+Returns:
+  A dictionary of column name: value.
+"""
+
+
+def multi_obs_params(rec, columns=MULTI_OBS_COLUMNS):
+    if type(rec) is tuple:
+        if columns is MULTI_OBS_COLUMNS:
+            return dict(zip(MULTI_OBS_COLUMNS, rec))
+        getter = _TUPLE_GETTERS.get(columns)
+        if getter is None:
+            getter = itemgetter(*[MULTI_OBS_COLUMNS.index(name) for name in columns])
+            _TUPLE_GETTERS[columns] = getter
+        return dict(zip(columns, getter(rec)))
+    return {name: getattr(rec, name, None) for name in columns}
+
+
+def record_sensor_id(rec):
+    if type(rec) is tuple:
+        return rec[SENSOR_ID_NDX]
+    return rec.sensor_id
+
+
+"""
+Function: put_record
+Purpose: Puts a record, or a list of tuple records, on a saver queue honoring the full_policy when the queue was
+created with a maxsize.
+Parameters:
+  data_queue is the saver queue.
+  rec is the entry to queue.
+  full_policy is QUEUE_FULL_BLOCK or QUEUE_FULL_DROP_OLDEST.
+Returns:
+  The number of records that were dropped to make room. A dropped list of tuple records counts each record in it.
+"""
+
+
+def put_record(data_queue, rec, full_policy=QUEUE_FULL_BLOCK):
+    if full_policy != QUEUE_FULL_DROP_OLDEST:
+        data_queue.put(rec)
+        return 0
+
+    dropped = 0
+    while True:
+        try:
+            data_queue.put_nowait(rec)
+            return dropped
+        except Full:
+            try:
+                dropped_entry = data_queue.get_nowait()
+                if type(dropped_entry) is list:
+                    dropped += len(dropped_entry)
+                else:
+                    dropped += 1
+            except Empty:
+                pass
+
+
+def get_record(data_queue, deadline=None):
+    if deadline is None:
+        return data_queue.get()
+    return data_queue.get(timeout=max(deadline - time.monotonic(), 0))
+
+
+def flush_due(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+"""
+Function: drain_queue
+Purpose: Blocks until a record is available on the queue, then keeps pulling records until batch_size records
+have been collected or flush_interval seconds have passed since the first one arrived, whichever comes first.
+Without a flush_interval only the records already waiting are pulled. Lists of tuple records are unpacked into
+the batch whole, so a batch can run over batch_size by part of one list.
+Parameters:
+  data_queue is the multiprocessing.Queue the producers put records on.
+  batch_size is the maximum number of records to return.
+  flush_interval is the longest, in seconds, the first record in a batch waits for the batch to fill.
+Returns:
+  A tuple of (records, stop). stop is True once the None sentinel has been pulled off the queue.
+"""
+
+
+def drain_queue(data_queue, batch_size, flush_interval=None):
+    records = []
+    data_rec = data_queue.get()
+    deadline = None
+    if flush_interval is not None:
+        deadline = time.monotonic() + flush_interval
+    while data_rec is not None:
+        if type(data_rec) is list:
+            records.extend(data_rec)
+        else:
+            records.append(data_rec)
+        if len(records) >= batch_size:
+            return records, False
+        try:
+            if deadline is None:
+                data_rec = data_queue.get_nowait()
+            else:
+                data_rec = get_record(data_queue, deadline)
+        except Empty:
+            return records, False
+    return records, True
+
+
+"""
+Function: build_multi_obs_insert
+Purpose: Builds the insert statement for the multi_obs table. With on_conflict set, the backend specific
+INSERT ... ON CONFLICT form is used so duplicate rows are skipped or updated by the database instead of raising
+an IntegrityError. DO UPDATE sets every column in multi_obs_columns(table) except the conflict columns and
+row_entry_date.
+Parameters:
+  table is the multi_obs Table object.
+  dialect_name is the engine dialect name, "sqlite" or "postgresql".
+  on_conflict is None, ON_CONFLICT_DO_NOTHING or ON_CONFLICT_DO_UPDATE.
+  conflict_columns are the unique columns ON CONFLICT DO UPDATE targets. DO NOTHING without conflict_columns
+    skips a row that violates any unique constraint.
+Returns:
+  The insert statement.
+"""
+
+
+def build_multi_obs_insert(table, dialect_name, on_conflict=None, conflict_columns=None):
+    from sqlalchemy import insert
+    if on_conflict is None:
+        return insert(table)
+
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise ValueError("ON CONFLICT inserts are not supported on %s." % (dialect_name))
+    stmt = dialect_insert(table)
+
+    if on_conflict == ON_CONFLICT_DO_NOTHING:
+        return stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+    elif on_conflict == ON_CONFLICT_DO_UPDATE:
+        if conflict_columns is None:
+            conflict_columns = DEFAULT_CONFLICT_COLUMNS
+        update_columns = {name: stmt.excluded[name] for name in multi_obs_columns(table)
+                          if name not in conflict_columns and name != 'row_entry_date'}
+        return stmt.on_conflict_do_update(index_elements=conflict_columns, set_=update_columns)
+    raise ValueError("Unknown on_conflict option: %s" % (on_conflict))
+
+
+"""
+Function: commit_session
+Purpose: Commits the records pending in the ORM session, rolling back on failure, and updates the saver metrics. An
+IntegrityError rolls back every pending record, not just the duplicate, so with a writer the pending records are
+written again through it and only the actual duplicates are dropped.
+Parameters:
+  db is the connected xeniaAlchemy object.
+  metrics is the SaverMetrics object to update.
+  pending_records is the list of records added to the session since the last commit.
+  logger is used to log unexpected errors.
+  writer, if provided, is the MultiObsBatchWriter used to retry the pending records after an IntegrityError.
+Returns:
+  True if the records were committed, otherwise False.
+"""
+
+
+def commit_session(db, metrics, pending_records, logger, writer=None):
+    from sqlalchemy import exc
+    commit_start = time.monotonic()
+    try:
+        db.session.commit()
+        metrics.record_commit(commit_start, len(pending_records))
+        return True
+    # Trying to add record that already exists.
+    except exc.IntegrityError:
+        db.session.rollback()
+        if writer is None:
+            metrics.record_rollback(duplicates=1, rolled_back=len(pending_records) - 1)
+            return False
+        metrics.record_rollback()
+        logger.debug("Commit of %d records hit an IntegrityError, retrying them in a batch." % (len(pending_records)))
+        try:
+            writer.write([multi_obs_to_tuple(rec) for rec in pending_records])
+            return True
+        except Exception as e:
+            metrics.record_rollback(rolled_back=len(pending_records))
+            logger.exception(e)
+    except Exception as e:
+        db.session.rollback()
+        metrics.record_rollback(rolled_back=len(pending_records))
+        logger.exception(e)
+    return False
+
+
+class MultiObsBatchWriter:
+    def __init__(self, db, table, logger=None, on_conflict=None, conflict_columns=None, metrics=None):
+        self._db = db
+        self._metrics = metrics
+        self._on_conflict = on_conflict
+        self._columns = multi_obs_columns(table)
+        self._insert_stmt = build_multi_obs_insert(table, db.dbEngine.dialect.name, on_conflict, conflict_columns)
+        self._logger = logger or logging.getLogger(type(self).__name__)
+
+    """
+    Function: write
+    Purpose: Inserts the batch of multi_obs records with one executemany inside a single transaction. When the writer
+    was built with on_conflict, duplicates are resolved by the database. Otherwise, if the batch hits an
+    IntegrityError, the transaction is rolled back and the records are inserted again one at a time inside a single
+    transaction, each behind its own savepoint, so a duplicate only rolls back its own row and the batch still costs
+    one commit.
+    Parameters:
+      records is a list of multi_obs objects or tuples in MULTI_OBS_COLUMNS order.
+    Returns:
+      The number of records inserted.
+    """
+
+    def write(self, records):
+        from sqlalchemy import exc
+        if not records:
+            return 0
+        params = [multi_obs_params(rec, self._columns) for rec in records]
+        if self._on_conflict is not None:
+            commit_start = time.monotonic()
+            with self._db.dbEngine.begin() as connection:
+                result = connection.execute(self._insert_stmt, params)
+            inserted = len(params)
+            if result.rowcount is not None and result.rowcount >= 0:
+                inserted = result.rowcount
+            if self._metrics is not None:
+                self._metrics.record_commit(commit_start, inserted, len(params) - inserted)
+            return inserted
+
+        try:
+            commit_start = time.monotonic()
+            with self._db.dbEngine.begin() as connection:
+                connection.execute(self._insert_stmt, params)
+            if self._metrics is not None:
+                self._metrics.record_commit(commit_start, len(params))
+            return len(params)
+        except exc.IntegrityError:
+            if self._metrics is not None:
+                self._metrics.record_rollback()
+            self._logger.debug("Batch of %d records hit an IntegrityError, retrying one at a time." % (len(params)))
+
+        inserted = 0
+        commit_start = time.monotonic()
+        with self._db.dbEngine.begin() as connection:
+            if connection.dialect.name == 'sqlite':
+                # pysqlite only opens a transaction ahead of an INSERT, not ahead of a SAVEPOINT. Without this each
+                # outermost savepoint would be a transaction of its own and be committed by its RELEASE.
+                connection.exec_driver_sql("BEGIN")
+            for row in params:
+                try:
+                    with connection.begin_nested():
+                        connection.execute(self._insert_stmt, row)
+                    inserted += 1
+                except exc.IntegrityError:
+                    pass
+        if self._metrics is not None:
+            self._metrics.record_commit(commit_start, inserted, len(params) - inserted)
+        return inserted
+
+
+class MultiObsSaverLoop:
+    """
+    Function: __init__
+    Purpose: The write loop shared by SQLiteMPDataSaver, MPDataSaverV2 and ThreadDataSaver, run by the saver once it
+    has connected. Records are pulled off the saver's queue and either added to the ORM session and committed every
+    records_before_commit records, or, in bulk mode, drained in batches of up to records_before_commit records and
+    written with a MultiObsBatchWriter.
+    Parameters:
+      db is the connected xeniaAlchemy object.
+      table is the multi_obs Table object of db's ORM module.
+      data_queue is the saver's queue. A queue with its own drain() method, like shm_ring_buffer.ObsRingBuffer, is
+        drained with it instead of drain_queue().
+      logger is the saver's logger.
+      metrics is the saver's saver_metrics.SaverMetrics.
+      records_before_commit is the number of records per commit, or the batch size in bulk mode.
+      bulk, if True, writes through the MultiObsBatchWriter instead of the ORM session.
+      flush_interval is the longest, in seconds, a record waits to be committed. None waits for
+        records_before_commit records.
+      on_conflict and conflict_columns are passed to the MultiObsBatchWriter.
+      spool_file, if provided, is the batch_spool.BatchSpool file uncommitted records are written to. Records left in
+        it are written before the loop starts. spool_sync fsyncs each write to the spool.
+    Records whose commit fails are kept, in the spool and in memory, and written again with the next commit, so a
+    locked database or a dropped connection does not lose them. The spool is only emptied of records once they are
+    committed.
+      duplicate_filter_size, if provided, is the capacity of the duplicate_filter.DuplicateFilter records are checked
+        against. With seed_duplicate_filter the filter starts out with the keys of the newest rows in multi_obs.
+    """
+
+    def __init__(self, db, table, data_queue, logger, metrics, records_before_commit=1, bulk=False,
+                 flush_interval=None, on_conflict=None, conflict_columns=None, spool_file=None, spool_sync=False,
+                 duplicate_filter_size=None, seed_duplicate_filter=True):
+        self._db = db
+        self._table = table
+        self._data_queue = data_queue
+        self._logger = logger
+        self._metrics = metrics
+        self._records_before_commit = records_before_commit
+        self._bulk = bulk
+        self._flush_interval = flush_interval
+        self._writer = MultiObsBatchWriter(db, table, logger, on_conflict, conflict_columns, metrics)
+        self._spool_file = spool_file
+        self._spool_sync = spool_sync
+        self._duplicate_filter_size = duplicate_filter_size
+        self._seed_duplicate_filter = seed_duplicate_filter
+        self._spool = None
+        self._dup_filter = None
+        # Tuples of the records whose commit failed, retried with the next commit.
+        self._unsaved = []
+
+    """
+    Function: run
+    Purpose: Replays the spool, seeds the duplicate filter, then writes records until the None sentinel is pulled off
+    the queue.
+    """
+
+    def run(self):
+        # Imported here, both modules import this one.
+        from .batch_spool import BatchSpool, replay_spool
+        from .duplicate_filter import DuplicateFilter
+
+        if self._spool_file is not None:
+            self._spool = BatchSpool(self._spool_file, self._spool_sync)
+            replay_spool(self._spool, self._writer, self._logger)
+        if self._duplicate_filter_size:
+            self._dup_filter = DuplicateFilter(self._duplicate_filter_size)
+            if self._seed_duplicate_filter:
+                self._logger.info("Seeded duplicate filter with %d keys." %
+                                  (self._dup_filter.seed(self._db, self._table)))
+            self._metrics.duplicate_filter = self._dup_filter
+        try:
+            if self._bulk:
+                self._run_bulk()
+            else:
+                self._run_orm()
+            if self._unsaved:
+                if self._spool is not None:
+                    self._logger.error("%d records could not be committed. They are left in the spool %s and are "
+                                       "written the next time the saver starts." %
+                                       (len(self._unsaved), self._spool.filename))
+                else:
+                    self._logger.error("%d records could not be committed." % (len(self._unsaved)))
+        finally:
+            if self._spool is not None:
+                self._spool.close()
+
+    def _write_unsaved(self, records=None):
+        # Writes the records of earlier failed commits, plus records, in one batch.
+        retried = self._unsaved
+        records = retried + [multi_obs_to_tuple(rec) for rec in (records or [])]
+        try:
+            self._writer.write(records)
+            self._unsaved = []
+            if self._dup_filter is not None:
+                self._dup_filter.remember(retried)
+            return True
+        except Exception as e:
+            self._metrics.record_rollback(rolled_back=len(records))
+            self._logger.exception(e)
+            self._unsaved = records
+        return False
+
+    def _settle_dup_filter(self, committed):
+        # The keys of the records that just went through the filter are only remembered once they are committed.
+        if self._dup_filter is None:
+            return
+        if committed:
+            self._dup_filter.commit()
+        else:
+            self._dup_filter.rollback()
+
+    def _update_spool(self, committed):
+        # Once a commit gets in, the spool only has to hold the records still waiting to be committed. Until then it
+        # is left alone, so a failed commit never empties it.
+        if self._spool is None or not committed:
+            return
+        self._spool.truncate()
+        self._spool.append(self._unsaved)
+
+    def _commit(self, pending_records):
+        committed = commit_session(self._db, self._metrics, pending_records, self._logger, self._writer)
+        self._settle_dup_filter(committed)
+        if not committed:
+            self._unsaved.extend([multi_obs_to_tuple(rec) for rec in pending_records])
+        elif self._unsaved:
+            self._write_unsaved()
+        self._update_spool(committed)
+
+    def _run_orm(self):
+        rec_count = 0
+        pending_records = []
+        commit_deadline = None
+        while True:
+            try:
+                data_rec = get_record(self._data_queue, commit_deadline)
+            except Empty:
+                # The flush interval ran out with records still uncommitted.
+                self._commit(pending_records)
+                pending_records = []
+                commit_deadline = None
+                continue
+            if data_rec is None:
+                self._commit(pending_records)
+                return
+            if self._dup_filter is not None and self._dup_filter.seen(data_rec):
+                continue
+            if self._spool is not None:
+                self._spool.append([data_rec])
+            self._db.session.add(data_rec)
+            rec_count += 1
+            pending_records.append(data_rec)
+            if (rec_count % self._records_before_commit) == 0 or flush_due(commit_deadline):
+                self._commit(pending_records)
+                pending_records = []
+                commit_deadline = None
+            elif commit_deadline is None and self._flush_interval is not None:
+                commit_deadline = time.monotonic() + self._flush_interval
+            self._metrics.maybe_publish(self._data_queue)
+
+    def _run_bulk(self):
+        stop = False
+        while not stop:
+            if hasattr(self._data_queue, 'drain'):
+                records, stop = self._data_queue.drain(self._records_before_commit, self._flush_interval)
+            else:
+                records, stop = drain_queue(self._data_queue, self._records_before_commit, self._flush_interval)
+            if records and self._dup_filter is not None:
+                records = self._dup_filter.filter(records)
+            if records:
+                if self._spool is not None:
+                    self._spool.append(records)
+                committed = self._write_unsaved(records)
+                self._settle_dup_filter(committed)
+                self._update_spool(committed)
+            self._metrics.maybe_publish(self._data_queue)
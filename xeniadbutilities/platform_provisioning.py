@@ -0,0 +1,161 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, insert
+
+from .sensor_resolution import resolve_sensors
+
+
+def _insert_with_row_ids(connection, allocator, table, rows):
+    # The type tables' row_id columns are not autoincrement, so the ids are reserved from the allocator.
+    row_ids = allocator.reserve(table.__tablename__, len(rows), connection)
+    for row, row_id in zip(rows, row_ids):
+        row['row_id'] = row_id
+    connection.execute(insert(table.__table__), rows)
+    return row_ids
+
+
+"""
+Function: provision_platforms
+Purpose: Set based version of buildMinimalPlatform for many platforms at once. The organizations, platforms,
+obs_types, uom_types, m_scalar_types, m_types and sensors the specs need are looked up with one query per table, and
+the missing ones are inserted with one executemany per table, all inside a single transaction.
+Parameters:
+  db is the connected xeniaAlchemy object.
+  models is the module with the ORM classes for the backend, xeniaSQLAlchemy or xeniaSQLiteAlchemy.
+  platform_specs is a list of dictionaries with:
+    platform_handle is the organization.short_name.type handle of the platform.
+    observations is a list of dictionaries with obs_name, uom_name and s_order, the same as the observation_list
+      buildMinimalPlatform takes.
+    Any other key that is a platform column, for instance fixed_longitude or description, is used when the platform
+    has to be added.
+  row_entry_date is used for the rows added, defaults to now.
+  logger is used to report what was added.
+Returns:
+  The resolved dictionary from resolve_sensors, keyed on (obs_name, uom_name, platform_handle, s_order) with the
+  (sensor_id, m_type_id) of every sensor in the specs.
+"""
+
+
+def provision_platforms(db, models, platform_specs, row_entry_date=None, logger=None):
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    if row_entry_date is None:
+        row_entry_date = datetime.now()
+    platform_columns = set(models.platform.__table__.columns.keys())
+
+    platforms = {}
+    sensor_keys = {}
+    for spec in platform_specs:
+        platform_handle = spec['platform_handle']
+        platforms[platform_handle] = {name: value for name, value in spec.items() if name in platform_columns}
+        for obs_info in spec.get('observations', []):
+            sensor_keys[(obs_info['obs_name'], obs_info['uom_name'], platform_handle,
+                         obs_info.get('s_order', 1))] = None
+    org_names = {platform_handle.split('.')[0] for platform_handle in platforms}
+    type_pairs = {(obs_name, uom_name) for obs_name, uom_name, platform_handle, s_order in sensor_keys}
+    obs_names = {obs_name for obs_name, uom_name in type_pairs}
+    uom_names = {uom_name for obs_name, uom_name in type_pairs}
+
+    organization = models.organization
+    platform = models.platform
+    obs_type = models.obs_type
+    uom_type = models.uom_type
+    m_scalar_type = models.m_scalar_type
+    m_type = models.m_type
+    sensor = models.sensor
+    allocator = db.row_id_allocator
+
+    with db.dbEngine.begin() as connection:
+        org_ids = dict(connection.execute(select(organization.short_name, organization.row_id)
+                                          .where(organization.short_name.in_(org_names))).all())
+        new_orgs = [{'row_entry_date': row_entry_date, 'short_name': name, 'active': 1}
+                    for name in org_names if name not in org_ids]
+        if new_orgs:
+            connection.execute(insert(organization.__table__), new_orgs)
+            org_ids = dict(connection.execute(select(organization.short_name, organization.row_id)
+                                              .where(organization.short_name.in_(org_names))).all())
+
+        platform_ids = dict(connection.execute(select(platform.platform_handle, platform.row_id)
+                                               .where(platform.platform_handle.in_(platforms))).all())
+        new_platforms = []
+        for platform_handle, platform_info in platforms.items():
+            if platform_handle not in platform_ids:
+                handle_parts = platform_handle.split('.')
+                platform_rec = {'row_entry_date': row_entry_date,
+                                'organization_id': org_ids[handle_parts[0]],
+                                'platform_handle': platform_handle,
+                                'short_name': handle_parts[1],
+                                'active': 1}
+                platform_rec.update(platform_info)
+                new_platforms.append(platform_rec)
+        if new_platforms:
+            # executemany needs the same keys in every row.
+            keys = set().union(*new_platforms)
+            connection.execute(insert(platform.__table__),
+                               [{key: rec.get(key) for key in keys} for rec in new_platforms])
+            platform_ids = dict(connection.execute(select(platform.platform_handle, platform.row_id)
+                                                   .where(platform.platform_handle.in_(platforms))).all())
+
+        obs_ids = dict(connection.execute(select(obs_type.standard_name, obs_type.row_id)
+                                          .where(obs_type.standard_name.in_(obs_names))).all())
+        new_obs = sorted(obs_names - set(obs_ids))
+        if new_obs:
+            row_ids = _insert_with_row_ids(connection, allocator, obs_type,
+                                           [{'standard_name': name} for name in new_obs])
+            obs_ids.update(zip(new_obs, row_ids))
+
+        uom_ids = dict(connection.execute(select(uom_type.standard_name, uom_type.row_id)
+                                          .where(uom_type.standard_name.in_(uom_names))).all())
+        new_uoms = sorted(uom_names - set(uom_ids))
+        if new_uoms:
+            row_ids = _insert_with_row_ids(connection, allocator, uom_type,
+                                           [{'standard_name': name} for name in new_uoms])
+            uom_ids.update(zip(new_uoms, row_ids))
+
+        id_pairs = {(obs_ids[obs_name], uom_ids[uom_name]) for obs_name, uom_name in type_pairs}
+        scalar_ids = {}
+        for row_id, obs_type_id, uom_type_id in connection.execute(
+                select(m_scalar_type.row_id, m_scalar_type.obs_type_id, m_scalar_type.uom_type_id)
+                .where(m_scalar_type.obs_type_id.in_({obs_type_id for obs_type_id, uom_type_id in id_pairs}))):
+            scalar_ids.setdefault((obs_type_id, uom_type_id), row_id)
+        new_scalars = sorted(id_pairs - set(scalar_ids))
+        if new_scalars:
+            row_ids = _insert_with_row_ids(connection, allocator, m_scalar_type,
+                                           [{'obs_type_id': obs_type_id, 'uom_type_id': uom_type_id}
+                                            for obs_type_id, uom_type_id in new_scalars])
+            scalar_ids.update(zip(new_scalars, row_ids))
+
+        needed_scalars = {scalar_ids[pair] for pair in id_pairs}
+        m_type_ids = {}
+        for row_id, scalar_id in connection.execute(select(m_type.row_id, m_type.m_scalar_type_id)
+                                                    .where(m_type.m_scalar_type_id.in_(needed_scalars))
+                                                    .order_by(m_type.row_id)):
+            m_type_ids.setdefault(scalar_id, row_id)
+        new_m_types = sorted(needed_scalars - set(m_type_ids))
+        if new_m_types:
+            row_ids = _insert_with_row_ids(connection, allocator, m_type,
+                                           [{'num_types': 1, 'm_scalar_type_id': scalar_id, 'description': ''}
+                                            for scalar_id in new_m_types])
+            m_type_ids.update(zip(new_m_types, row_ids))
+
+        existing_sensors = set(connection.execute(select(sensor.platform_id, sensor.m_type_id, sensor.s_order)
+                                                  .where(sensor.platform_id.in_(platform_ids.values()))).all())
+        new_sensors = []
+        for obs_name, uom_name, platform_handle, s_order in sensor_keys:
+            m_type_id = m_type_ids[scalar_ids[(obs_ids[obs_name], uom_ids[uom_name])]]
+            platform_id = platform_ids[platform_handle]
+            if (platform_id, m_type_id, s_order) not in existing_sensors:
+                existing_sensors.add((platform_id, m_type_id, s_order))
+                new_sensors.append({'row_entry_date': row_entry_date, 'platform_id': platform_id,
+                                    'm_type_id': m_type_id, 'short_name': obs_name, 'fixed_z': 0, 'active': 1,
+                                    's_order': s_order})
+        if new_sensors:
+            connection.execute(insert(sensor.__table__), new_sensors)
+
+    logger.debug("Provisioned %d platforms. Added organizations: %d platforms: %d obs_types: %d uom_types: %d "
+                 "m_scalar_types: %d m_types: %d sensors: %d" % (
+                     len(platforms), len(new_orgs), len(new_platforms), len(new_obs), len(new_uoms),
+                     len(new_scalars), len(new_m_types), len(new_sensors)))
+    resolved, unresolved = resolve_sensors(db, models, list(sensor_keys))
+    return resolved
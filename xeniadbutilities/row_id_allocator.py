@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+
+from sqlalchemy import text
+
+DEFAULT_BLOCK_SIZE = 100
+# SQLite has no sequences, the next free row_id of each table is kept in this table instead.
+ALLOCATION_TABLE = 'xenia_row_id_allocation'
+_TABLE_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class RowIdAllocator:
+    """
+    Function: __init__
+    Purpose: Hands out row_ids for the metadata tables whose row_id is not autoincrement (obs_type, uom_type,
+    m_scalar_type, m_type). Ids are reserved from the database a block at a time, so adding rows does not run a
+    SELECT max(row_id) per insert, and two processes provisioning at the same time never get the same id.
+    On PostgreSQL each table gets a <table>_row_id_alloc_seq sequence that increments by the block size. On SQLite
+    the next free id per table is kept in the xenia_row_id_allocation table and bumped in a write transaction.
+    Either way the first reservation starts after the table's current max(row_id).
+    Writers that do not use the allocator, xenia.py's xeniaSQLite for instance, can still take an id inside a block
+    this allocator has cached. Reservations made inside the caller's transaction are always checked against
+    max(row_id), and invalidate() drops a table's cached block after an insert hits such an id.
+    Parameters:
+      engine is the SQLAlchemy engine of the database.
+      block_size is the number of ids reserved per round trip.
+    """
+
+    def __init__(self, engine, block_size=DEFAULT_BLOCK_SIZE):
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1.")
+        self._engine = engine
+        self._block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._increments = {}
+        self._pid = os.getpid()
+
+    def next_id(self, table_name, connection=None):
+        return self.reserve(table_name, 1, connection)[0]
+
+    """
+    Function: reserve
+    Purpose: Reserves count row_ids for table_name.
+    Parameters:
+      table_name is the table the ids are for.
+      count is the number of ids needed.
+      connection, if provided, is used for the reservation so it runs inside the caller's transaction. The cached
+        block is not used, the ids are reserved past the table's current max(row_id). On SQLite the reservation is
+        then exactly count ids, since a rollback of the caller's transaction also gives them back.
+    Returns:
+      A list of count unused row_ids, ascending.
+    """
+
+    def reserve(self, table_name, count, connection=None):
+        if not _TABLE_NAME_RE.match(table_name):
+            raise ValueError("Invalid table name: %s" % (table_name))
+        with self._lock:
+            # Blocks reserved before a fork belong to the parent.
+            if os.getpid() != self._pid:
+                self._blocks.clear()
+                self._pid = os.getpid()
+
+            row_ids = []
+            if connection is not None:
+                # The cached block may have been written into by another writer since it was reserved.
+                self._blocks.pop(table_name, None)
+                if self._engine.dialect.name == 'sqlite':
+                    start_row_id = self._reserve_sqlite(connection, table_name, count)
+                    return list(range(start_row_id, start_row_id + count))
+                self._sync_postgres(connection, table_name)
+            next_row_id, end_row_id = self._blocks.get(table_name, (0, 0))
+            while len(row_ids) < count:
+                if next_row_id >= end_row_id:
+                    next_row_id, end_row_id = self._reserve_block(table_name, connection)
+                take = min(count - len(row_ids), end_row_id - next_row_id)
+                row_ids.extend(range(next_row_id, next_row_id + take))
+                next_row_id += take
+            self._blocks[table_name] = (next_row_id, end_row_id)
+            return row_ids
+
+    """
+    Function: invalidate
+    Purpose: Drops the block cached for table_name, so the next reservation starts past the table's current
+    max(row_id). Called when an insert with an allocated id fails because another writer already used the id.
+    Parameters:
+      table_name is the table the ids are for.
+      connection, if provided, is used on PostgreSQL to move the table's sequence past max(row_id).
+    """
+
+    def invalidate(self, table_name, connection=None):
+        if not _TABLE_NAME_RE.match(table_name):
+            raise ValueError("Invalid table name: %s" % (table_name))
+        with self._lock:
+            self._blocks.pop(table_name, None)
+            # SQLite reservations already skip past max(row_id).
+            if self._engine.dialect.name == 'postgresql':
+                if connection is not None:
+                    self._sync_postgres(connection, table_name)
+                else:
+                    with self._engine.begin() as connection:
+                        self._sync_postgres(connection, table_name)
+
+    def _reserve_block(self, table_name, connection):
+        if connection is not None:
+            return self._reserve_postgres(connection, table_name)
+        with self._engine.begin() as connection:
+            if self._engine.dialect.name == 'postgresql':
+                return self._reserve_postgres(connection, table_name)
+            start_row_id = self._reserve_sqlite(connection, table_name, self._block_size)
+            return start_row_id, start_row_id + self._block_size
+
+    def _reserve_sqlite(self, connection, table_name, count):
+        connection.execute(text("CREATE TABLE IF NOT EXISTS %s "
+                                "(table_name TEXT PRIMARY KEY, next_row_id INTEGER NOT NULL)" % (ALLOCATION_TABLE)))
+        connection.execute(text("INSERT OR IGNORE INTO %s (table_name, next_row_id) VALUES (:table_name, 1)"
+                                % (ALLOCATION_TABLE)), {'table_name': table_name})
+        # Rows added without the allocator are skipped over by starting from max(row_id) when it is further along.
+        connection.execute(text("UPDATE %s SET next_row_id = max(next_row_id, "
+                                "(SELECT coalesce(max(row_id), 0) + 1 FROM %s)) + :count WHERE table_name = :table_name"
+                                % (ALLOCATION_TABLE, table_name)), {'count': count, 'table_name': table_name})
+        end_row_id = connection.execute(text("SELECT next_row_id FROM %s WHERE table_name = :table_name"
+                                             % (ALLOCATION_TABLE)), {'table_name': table_name}).scalar()
+        return end_row_id - count
+
+    def _reserve_postgres(self, connection, table_name):
+        sequence_name = self._ensure_postgres_sequence(connection, table_name)
+        start_row_id = connection.execute(text("SELECT nextval('%s')" % (sequence_name))).scalar()
+        return start_row_id, start_row_id + self._increments[table_name]
+
+    def _sync_postgres(self, connection, table_name):
+        sequence_name = self._ensure_postgres_sequence(connection, table_name)
+        # Only ever moves the sequence forward, to max(row_id) + 1 when rows were added past the next block without
+        # the allocator, so no block already handed out is handed out again.
+        connection.execute(text("SELECT setval('%s', table_max.next_row_id, false) "
+                                "FROM (SELECT coalesce(max(row_id), 0) + 1 AS next_row_id FROM %s) table_max, %s seq "
+                                "WHERE table_max.next_row_id > "
+                                "seq.last_value + CASE WHEN seq.is_called THEN :increment ELSE 0 END"
+                                % (sequence_name, table_name, sequence_name)),
+                           {'increment': self._increments[table_name]})
+
+    def _ensure_postgres_sequence(self, connection, table_name):
+        sequence_name = "%s_row_id_alloc_seq" % (table_name)
+        if table_name not in self._increments:
+            # Serialize creating the sequence so it is only started from max(row_id) once.
+            connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:sequence_name))"),
+                               {'sequence_name': sequence_name})
+            exists = connection.execute(text("SELECT to_regclass(:sequence_name) IS NOT NULL"),
+                                        {'sequence_name': sequence_name}).scalar()
+            if not exists:
+                connection.execute(text("CREATE SEQUENCE %s INCREMENT BY %d" % (sequence_name, self._block_size)))
+                connection.execute(text("SELECT setval('%s', (SELECT coalesce(max(row_id), 0) + 1 FROM %s), false)"
+                                        % (sequence_name, table_name)))
+            self._increments[table_name] = connection.execute(
+                text("SELECT increment_by FROM pg_sequences "
+                     "WHERE schemaname = current_schema() AND sequencename = :sequence_name"),
+                {'sequence_name': sequence_name}).scalar()
+        return sequence_name
@@ -0,0 +1,122 @@
+import time
+from bisect import bisect_left
+from queue import Full
+
+# Upper bounds, in milliseconds, of the commit latency histogram buckets. The last bucket catches everything slower.
+COMMIT_LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class SaverMetrics:
+    """
+    Function: __init__
+    Purpose: Counters a saver process keeps while it writes. Snapshots are put on metrics_queue every
+    publish_interval seconds so the parent can watch ingest progress without the saver logging per record.
+    Parameters:
+      worker_name is included in each snapshot to tell the workers apart when they share a metrics_queue.
+      metrics_queue is a multiprocessing.Queue the snapshots are put on. If None, nothing is published.
+      publish_interval is the number of seconds between snapshots.
+    """
+
+    def __init__(self, worker_name, metrics_queue=None, publish_interval=10.0):
+        self._worker_name = worker_name
+        self._metrics_queue = metrics_queue
+        self._publish_interval = publish_interval
+        self.records_written = 0
+        self.duplicates_skipped = 0
+        self.rollbacks = 0
+        # Records rolled back by a failed commit, not counting duplicates. The savers retry them with their next commit.
+        self.records_rolled_back = 0
+        self.commits = 0
+        self.commit_latency = [0] * (len(COMMIT_LATENCY_BUCKETS_MS) + 1)
+        # The saver's duplicate_filter.DuplicateFilter, if it has one. Its counters are included in the snapshots.
+        self.duplicate_filter = None
+        self._start_time = time.monotonic()
+        self._last_publish_time = self._start_time
+        self._last_publish_count = 0
+
+    def record_commit(self, start_time, written, duplicates=0):
+        latency_ms = (time.monotonic() - start_time) * 1000.0
+        self.commit_latency[bisect_left(COMMIT_LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.commits += 1
+        self.records_written += written
+        self.duplicates_skipped += duplicates
+
+    def record_rollback(self, duplicates=0, rolled_back=0):
+        self.rollbacks += 1
+        self.duplicates_skipped += duplicates
+        self.records_rolled_back += rolled_back
+
+    """
+    Function: snapshot
+    Purpose: Builds the dictionary that is published to the parent.
+    Parameters:
+      queue_depth is the approximate number of entries waiting on the saver's queue, or None if unknown.
+    Returns:
+      A dictionary of the current counters. records_per_sec is the rate since the previous snapshot.
+    """
+
+    def snapshot(self, queue_depth=None):
+        now = time.monotonic()
+        elapsed = now - self._last_publish_time
+        records_per_sec = 0.0
+        if elapsed > 0:
+            records_per_sec = (self.records_written - self._last_publish_count) / elapsed
+        self._last_publish_time = now
+        self._last_publish_count = self.records_written
+
+        latency_histogram = {}
+        for ndx, upper_bound in enumerate(COMMIT_LATENCY_BUCKETS_MS):
+            latency_histogram[upper_bound] = self.commit_latency[ndx]
+        latency_histogram['inf'] = self.commit_latency[-1]
+
+        filter_hits = None
+        filter_misses = None
+        if self.duplicate_filter is not None:
+            filter_hits = self.duplicate_filter.hits
+            filter_misses = self.duplicate_filter.misses
+
+        return {
+            'worker': self._worker_name,
+            'elapsed_seconds': now - self._start_time,
+            'records_per_sec': records_per_sec,
+            'records_written': self.records_written,
+            'duplicates_skipped': self.duplicates_skipped,
+            'rollbacks': self.rollbacks,
+            'records_rolled_back': self.records_rolled_back,
+            'commits': self.commits,
+            'commit_latency_ms': latency_histogram,
+            'queue_depth': queue_depth,
+            'duplicate_filter_hits': filter_hits,
+            'duplicate_filter_misses': filter_misses,
+        }
+
+    def publish_due(self):
+        return self._metrics_queue is not None and \
+            (time.monotonic() - self._last_publish_time) >= self._publish_interval
+
+    """
+    Function: publish
+    Purpose: Puts a snapshot on the metrics queue. A full metrics queue drops the snapshot rather than stall the
+    saver.
+    Parameters:
+      data_queue is the saver's queue, used for the queue depth.
+    """
+
+    def publish(self, data_queue=None):
+        if self._metrics_queue is None:
+            return
+        queue_depth = None
+        if data_queue is not None:
+            try:
+                queue_depth = data_queue.qsize()
+            # We get this exception under OSX.
+            except NotImplementedError:
+                pass
+        try:
+            self._metrics_queue.put_nowait(self.snapshot(queue_depth))
+        except Full:
+            pass
+
+    def maybe_publish(self, data_queue=None):
+        if self.publish_due():
+            self.publish(data_queue)
@@ -0,0 +1,43 @@
+class SensorIdCache:
+    """
+    Function: __init__
+    Purpose: Memoizes the sensor ids xeniaAlchemy.sensorExists resolves, keyed on (obsName, uom, platformHandle,
+    sOrder). Only sensors that were found are cached, a missing sensor is looked up again on the next call since it
+    may have been added since. Each connection gets its own cache.
+    """
+
+    def __init__(self):
+        self._sensor_ids = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._sensor_ids)
+
+    def get(self, key):
+        sensor_id = self._sensor_ids.get(key)
+        if sensor_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return sensor_id
+
+    def put(self, key, sensor_id):
+        if sensor_id is not None:
+            self._sensor_ids[key] = sensor_id
+
+    """
+    Function: invalidate
+    Purpose: Drops cached sensor ids, for instance after sensors were deleted or renumbered outside this connection.
+    Parameters:
+      key is the (obsName, uom, platformHandle, sOrder) to drop. If None the whole cache is cleared.
+    """
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._sensor_ids.clear()
+        else:
+            self._sensor_ids.pop(key, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._sensor_ids)}
@@ -0,0 +1,51 @@
+from sqlalchemy import select, tuple_
+
+# Keys per statement. Each key binds four parameters and SQLite before 3.32 allows at most 999 bound parameters.
+RESOLVE_CHUNK_SIZE = 249
+
+
+"""
+Function: resolve_sensors
+Purpose: Looks up the sensor_id and m_type_id for many sensors at once, with one statement for up to
+RESOLVE_CHUNK_SIZE keys instead of a sensorExists and mTypeExists query per sensor.
+Parameters:
+  db is the connected xeniaAlchemy object. The lookup runs through its session, so sensors added to the session but
+    not yet committed are found. Resolved ids are also put in its sensor_cache.
+  models is the module with the ORM classes for the backend, xeniaSQLAlchemy or xeniaSQLiteAlchemy.
+  sensor_keys is a list of (obsName, uom, platformHandle, sOrder) tuples. sOrder can be left off, it defaults to 1.
+Returns:
+  A tuple of (resolved, unresolved). resolved is a dictionary of key: (sensor_id, m_type_id), unresolved is the
+  list of keys no sensor was found for, in the order they were given.
+"""
+
+
+def resolve_sensors(db, models, sensor_keys):
+    keys = {}
+    for key in sensor_keys:
+        key = tuple(key)
+        if len(key) == 3:
+            key = key + (1,)
+        keys[key] = None
+    keys = list(keys)
+
+    sensor = models.sensor
+    stmt_base = select(models.obs_type.standard_name, models.uom_type.standard_name, models.platform.platform_handle,
+                       sensor.s_order, sensor.row_id, sensor.m_type_id) \
+        .join(models.platform, models.platform.row_id == sensor.platform_id) \
+        .join(models.m_type, models.m_type.row_id == sensor.m_type_id) \
+        .join(models.m_scalar_type, models.m_scalar_type.row_id == models.m_type.m_scalar_type_id) \
+        .join(models.obs_type, models.obs_type.row_id == models.m_scalar_type.obs_type_id) \
+        .join(models.uom_type, models.uom_type.row_id == models.m_scalar_type.uom_type_id)
+    key_columns = tuple_(models.obs_type.standard_name, models.uom_type.standard_name,
+                         models.platform.platform_handle, sensor.s_order)
+
+    resolved = {}
+    for start in range(0, len(keys), RESOLVE_CHUNK_SIZE):
+        stmt = stmt_base.where(key_columns.in_(keys[start:start + RESOLVE_CHUNK_SIZE]))
+        for obs_name, uom, platform_handle, s_order, sensor_id, m_type_id in db.session.execute(stmt):
+            resolved[(obs_name, uom, platform_handle, s_order)] = (sensor_id, m_type_id)
+
+    for key, (sensor_id, m_type_id) in resolved.items():
+        db.sensor_cache.put(key, sensor_id)
+    unresolved = [key for key in keys if key not in resolved]
+    return resolved, unresolved
@@ -0,0 +1,214 @@
+import struct
+import time
+from multiprocessing import Lock
+from multiprocessing.shared_memory import SharedMemory
+
+from .multi_obs_writer import MULTI_OBS_COLUMNS, multi_obs_to_tuple
+
+# struct codes for each multi_obs column in a slot. Strings are fixed width, null padded.
+_COLUMN_FORMATS = {
+    'row_entry_date': '32s',
+    'row_update_date': '32s',
+    'platform_handle': '100s',
+    'sensor_id': 'q',
+    'm_type_id': 'q',
+    'm_date': '32s',
+    'm_lon': 'd',
+    'm_lat': 'd',
+    'm_z': 'd',
+    'm_value': 'd',
+    'm_value_2': 'd',
+    'm_value_3': 'd',
+    'm_value_4': 'd',
+    'm_value_5': 'd',
+    'm_value_6': 'd',
+    'm_value_7': 'd',
+    'm_value_8': 'd',
+    'qc_metadata_id': 'q',
+    'qc_level': 'q',
+    'qc_flag': '100s',
+    'qc_metadata_id_2': 'q',
+    'qc_level_2': 'q',
+    'qc_flag_2': '100s',
+    'metadata_id': 'q',
+    'd_label_theta': 'q',
+    'd_top_of_hour': 'q',
+    'd_report_hour': '32s',
+}
+# the_geom has no fixed width form, the transport is only used with the SQLite model, which has no the_geom.
+_GEOM_NDX = MULTI_OBS_COLUMNS.index('the_geom')
+_SLOT_COLUMNS = tuple(name for name in MULTI_OBS_COLUMNS if name != 'the_geom')
+_COLUMN_CODES = [_COLUMN_FORMATS[name] for name in _SLOT_COLUMNS]
+_STRING_COLUMNS = [code.endswith('s') for code in _COLUMN_CODES]
+_STRING_WIDTHS = [int(code[:-1]) if code.endswith('s') else None for code in _COLUMN_CODES]
+_EMPTY_VALUES = [b'' if is_string else 0 for is_string in _STRING_COLUMNS]
+# Each slot starts with a bitmask of the columns that are None.
+_SLOT_STRUCT = struct.Struct('<I' + ''.join(_COLUMN_CODES))
+# Header holds the producer cursor, the consumer cursor and the closed flag.
+_HEADER_STRUCT = struct.Struct('<QQQ')
+_CURSORS_STRUCT = struct.Struct('<QQ')
+_TAIL_OFFSET = 8
+_CLOSED_OFFSET = 16
+_HEADER_SIZE = 64
+_POLL_INTERVAL = 0.001
+
+
+class ObsRingBuffer:
+    """
+    Function: __init__
+    Purpose: A fixed size ring buffer of multi_obs slots in shared memory, used in place of a multiprocessing.Queue
+    to hand records from producers to a saver process. Producers advance the producer cursor after writing slots, the
+    consumer reads every slot between the two cursors in one pass and then advances the consumer cursor, so there is
+    no pipe write or lock per record on the consumer side.
+    Parameters:
+      capacity is the number of record slots.
+      name is the shared memory block name. If None a new block is created, otherwise the named block is attached.
+    """
+
+    def __init__(self, capacity, name=None):
+        self._capacity = capacity
+        self._owner = name is None
+        if self._owner:
+            self._shm = SharedMemory(create=True, size=_HEADER_SIZE + (capacity * _SLOT_STRUCT.size))
+            _HEADER_STRUCT.pack_into(self._shm.buf, 0, 0, 0, 0)
+        else:
+            self._shm = SharedMemory(name=name)
+        # Serializes multiple producers, the consumer never takes it.
+        self._producer_lock = Lock()
+
+    def __getstate__(self):
+        return {'capacity': self._capacity, 'name': self._shm.name, 'producer_lock': self._producer_lock}
+
+    def __setstate__(self, state):
+        self._capacity = state['capacity']
+        self._owner = False
+        self._shm = SharedMemory(name=state['name'])
+        self._producer_lock = state['producer_lock']
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def _cursors(self):
+        # Read the closed flag first. The producer sets it after publishing its last cursor, so if we see it set
+        # the cursor we read next is final.
+        closed = struct.unpack_from('<Q', self._shm.buf, _CLOSED_OFFSET)[0]
+        head, tail = _CURSORS_STRUCT.unpack_from(self._shm.buf, 0)
+        return head, tail, closed
+
+    def qsize(self):
+        head, tail, closed = self._cursors()
+        return head - tail
+
+    def _pack_slot(self, cursor, rec):
+        values = list(multi_obs_to_tuple(rec))
+        if values.pop(_GEOM_NDX) is not None:
+            raise ValueError("the_geom can not be carried by the shared memory transport.")
+        null_mask = 0
+        for ndx, value in enumerate(values):
+            if value is None:
+                null_mask |= (1 << ndx)
+                values[ndx] = _EMPTY_VALUES[ndx]
+            elif _STRING_COLUMNS[ndx]:
+                if hasattr(value, 'isoformat'):
+                    value = value.isoformat()
+                value = value.encode('utf-8')
+                if len(value) > _STRING_WIDTHS[ndx]:
+                    raise ValueError("%s is longer than its %d byte slot." % (_SLOT_COLUMNS[ndx],
+                                                                             _STRING_WIDTHS[ndx]))
+                values[ndx] = value
+        offset = _HEADER_SIZE + ((cursor % self._capacity) * _SLOT_STRUCT.size)
+        _SLOT_STRUCT.pack_into(self._shm.buf, offset, null_mask, *values)
+
+    """
+    Function: put_many
+    Purpose: Writes the records into free slots, waiting for the consumer if the buffer is full.
+    Parameters:
+      records is a list of multi_obs objects or tuples in MULTI_OBS_COLUMNS order.
+    """
+
+    def put_many(self, records):
+        with self._producer_lock:
+            head, tail, closed = self._cursors()
+            for rec in records:
+                while head - tail >= self._capacity:
+                    # Publish what we have so the consumer can make room.
+                    struct.pack_into('<Q', self._shm.buf, 0, head)
+                    time.sleep(_POLL_INTERVAL)
+                    tail = self._cursors()[1]
+                self._pack_slot(head, rec)
+                head += 1
+            struct.pack_into('<Q', self._shm.buf, 0, head)
+
+    """
+    Function: put
+    Purpose: Queue compatible put. None closes the buffer the same way the None sentinel stops a saver queue.
+    """
+
+    def put(self, rec):
+        if rec is None:
+            self.close()
+        else:
+            self.put_many([rec])
+
+    def close(self):
+        with self._producer_lock:
+            struct.pack_into('<Q', self._shm.buf, _CLOSED_OFFSET, 1)
+
+    def _unpack_range(self, start, count):
+        records = []
+        while count:
+            slot = start % self._capacity
+            slot_count = min(count, self._capacity - slot)
+            offset = _HEADER_SIZE + (slot * _SLOT_STRUCT.size)
+            slot_range = self._shm.buf[offset:offset + (slot_count * _SLOT_STRUCT.size)]
+            for slot_values in _SLOT_STRUCT.iter_unpack(slot_range):
+                null_mask = slot_values[0]
+                rec = []
+                for ndx, value in enumerate(slot_values[1:]):
+                    if null_mask & (1 << ndx):
+                        value = None
+                    elif _STRING_COLUMNS[ndx]:
+                        value = value.rstrip(b'\0').decode('utf-8')
+                    rec.append(value)
+                rec.insert(_GEOM_NDX, None)
+                records.append(tuple(rec))
+            start += slot_count
+            count -= slot_count
+        return records
+
+    """
+    Function: drain
+    Purpose: Consumer side. Waits until records are available, then reads up to batch_size of them in one pass. With
+    a flush_interval it waits up to flush_interval seconds for batch_size records to be available first.
+    Parameters:
+      batch_size is the maximum number of records to return.
+      flush_interval is the longest, in seconds, to wait for the batch to fill once a record is available.
+    Returns:
+      A tuple of (records, stop), matching multi_obs_writer.drain_queue. stop is True once the buffer has been
+      closed and every record in it has been read.
+    """
+
+    def drain(self, batch_size, flush_interval=None):
+        head, tail, closed = self._cursors()
+        while head == tail and not closed:
+            time.sleep(_POLL_INTERVAL)
+            head, tail, closed = self._cursors()
+        if flush_interval is not None:
+            deadline = time.monotonic() + flush_interval
+            while head - tail < batch_size and not closed and time.monotonic() < deadline:
+                time.sleep(_POLL_INTERVAL)
+                head, tail, closed = self._cursors()
+        count = min(head - tail, batch_size)
+        records = self._unpack_range(tail, count)
+        struct.pack_into('<Q', self._shm.buf, _TAIL_OFFSET, tail + count)
+        return records, (closed and (tail + count) == head)
+
+    def release(self):
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
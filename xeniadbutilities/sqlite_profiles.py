@@ -0,0 +1,35 @@
+"""
+Named sets of PRAGMAs applied to each new SQLite connection.
+  default: SQLite's own settings.
+  bulk_ingest: WAL journaling with synchronous=NORMAL, a 256MB page cache and in memory temp tables. Meant for the
+    data savers; a commit no longer waits on an fsync of the database file.
+  analytics_readonly: the connection refuses writes and reads through a 256MB memory map.
+"""
+
+SQLITE_PROFILES = {
+    'default': (),
+    'bulk_ingest': (
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        # Negative values are in KiB.
+        ('cache_size', -262144),
+        ('temp_store', 'MEMORY'),
+    ),
+    'analytics_readonly': (
+        ('query_only', 'ON'),
+        ('mmap_size', 268435456),
+    ),
+}
+
+
+def apply_sqlite_profile(dbapi_connection, profile):
+    if profile is None:
+        return
+    if profile not in SQLITE_PROFILES:
+        raise ValueError("Unknown SQLite profile: %s" % (profile))
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in SQLITE_PROFILES[profile]:
+            cursor.execute("PRAGMA %s=%s" % (pragma, value))
+    finally:
+        cursor.close()
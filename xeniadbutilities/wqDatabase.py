@@ -1,13 +1,12 @@
 import logging.config
 import sqlite3
 from datetime import datetime, timedelta
-from pytz import timezone
-from stats import vectorMagDir
+from .stats import vectorMagDir
 from .xenia import xeniaSQLite
 
 
 class wqDB(xeniaSQLite):
-    def __init__(self, dbName, use_logger=True):
+    def __init__(self, dbName, use_logger=True, profile=None, cached_statements=None):
         xeniaSQLite.__init__(self)
         self.logger = None
         if use_logger:
@@ -16,7 +15,7 @@ class wqDB(xeniaSQLite):
 
         self.totalRowsProcd = 0
         self.lastErrorMsg = None
-        if not xeniaSQLite.connect(self, dbName):
+        if not xeniaSQLite.connect(self, dbName, profile=profile, cached_statements=cached_statements):
             if self.logger:
                 self.logger.error(self.lastErrorMsg)
             raise Exception("Unable to connect to database")
@@ -46,13 +45,13 @@ class wqDB(xeniaSQLite):
             sql = "SELECT SUM(m_value) \
              FROM multi_obs \
              WHERE\
-               m_date >= '%s' AND\
-               m_date < '%s' AND\
-               sensor_id = %d AND m_value >= 0.0;" \
-                  % (start_date.strftime('%Y-%m-%dT%H:%M:%S'), dateTime.strftime('%Y-%m-%dT%H:%M:%S'), sensorID)
+               m_date >= ? AND\
+               m_date < ? AND\
+               sensor_id = ? AND m_value >= 0.0;"
             try:
                 dbCursor = self.DB.cursor()
-                dbCursor.execute(sql)
+                dbCursor.execute(sql, (start_date.strftime('%Y-%m-%dT%H:%M:%S'),
+                                       dateTime.strftime('%Y-%m-%dT%H:%M:%S'), sensorID))
             except sqlite3.Error as e:
                 if self.logger:
                     self.logger.exception(e)
@@ -68,11 +67,11 @@ class wqDB(xeniaSQLite):
 
     def findGaps(self, startDate, endDate, sensorId, allowedGapSecs=7200):
         hasGap = False
-        sql = "SELECT m_date FROM multi_obs WHERE ( m_date < '%s' AND m_date > '%s') AND sensor_id=%d ORDER BY m_date DESC;" \
-              % (startDate.strftime("%Y-%m-%dT%H:%M:%S"), endDate.strftime("%Y-%m-%dT%H:%M:%S"), sensorId)
+        sql = "SELECT m_date FROM multi_obs WHERE ( m_date < ? AND m_date > ?) AND sensor_id=? ORDER BY m_date DESC;"
         try:
             dbCursor = self.DB.cursor()
-            dbCursor.execute(sql)
+            dbCursor.execute(sql, (startDate.strftime("%Y-%m-%dT%H:%M:%S"), endDate.strftime("%Y-%m-%dT%H:%M:%S"),
+                                   sensorId))
         except sqlite3.Error as e:
             if self.logger:
                 self.logger.exception(e)
@@ -110,12 +109,12 @@ class wqDB(xeniaSQLite):
         sensorId = xeniaSQLite.sensorExists(self, obs_type, uom, platform_handle)
         if sensorId != None and sensorId != -1:
             # We want to start our dry day search the day before our dateTime.
-            sql = "SELECT m_date FROM multi_obs WHERE m_date < '%s' AND sensor_id=%d AND m_value > 0 ORDER BY m_date DESC LIMIT 1;" \
-                  % (dateTime.strftime("%Y-%m-%dT%H:%M:%S"), sensorId)
+            sql = "SELECT m_date FROM multi_obs WHERE m_date < ? AND sensor_id=? AND m_value > 0 " \
+                  "ORDER BY m_date DESC LIMIT 1;"
 
             try:
                 dbCursor = self.DB.cursor()
-                dbCursor.execute(sql)
+                dbCursor.execute(sql, (dateTime.strftime("%Y-%m-%dT%H:%M:%S"), sensorId))
             except sqlite3.Error as e:
                 if self.logger:
                     self.logger.exception(e)
@@ -123,6 +122,7 @@ class wqDB(xeniaSQLite):
             else:
                 row = dbCursor.fetchone()
                 if row:
+                    from pytz import timezone
                     first_val = timezone('UTC').localize(datetime.strptime(row['m_date'], "%Y-%m-%dT%H:%M:%S"))
                     # Now let's check and make sure we're not missing data in between out date of interest
                     # and the first date we have with rainfall.
@@ -167,14 +167,13 @@ class wqDB(xeniaSQLite):
         # AND m_date < strftime('%%Y-%%m-%%dT%%H:%%M:%%S', '%s' ) AND\
         sql = "SELECT m_value from multi_obs \
             WHERE \
-            m_date >= '%s' AND m_date < '%s' AND\
-            sensor_id = %d AND\
-            platform_handle = '%s';" \
-              % (start_date.strftime("%Y-%m-%dT%H:%M:%S"), dateTime.strftime("%Y-%m-%dT%H:%M:%S"), sensor_id,
-                 platform_handle)
+            m_date >= ? AND m_date < ? AND\
+            sensor_id = ? AND\
+            platform_handle = ?;"
         try:
             dbCursor = self.DB.cursor()
-            dbCursor.execute(sql)
+            dbCursor.execute(sql, (start_date.strftime("%Y-%m-%dT%H:%M:%S"), dateTime.strftime("%Y-%m-%dT%H:%M:%S"),
+                                   sensor_id, platform_handle))
         except sqlite3.Error as e:
             if self.logger:
                 self.logger.exception(e)
@@ -270,26 +269,23 @@ class wqDB(xeniaSQLite):
         windDirId = xeniaSQLite.sensorExists(self, wind_dir_obsname, wind_dir_uom, platName)
         if windSpdId is not None and windSpdId != -1 and \
                 windDirId is not None and windDirId != -1:
-            spd_sql = "SELECT m_date ,m_value FROM multi_obs\
-             WHERE sensor_id = %d AND\
-             (m_date >= '%s' AND \
-             m_date < '%s' ) ORDER BY m_date" \
-                      % (windSpdId, startDate, endDate)
+            sql = "SELECT m_date ,m_value FROM multi_obs\
+             WHERE sensor_id = ? AND\
+             (m_date >= ? AND \
+             m_date < ? ) ORDER BY m_date"
+            # The dates are bound as the text they were formatted into the SQL as.
+            spd_params = (windSpdId, str(startDate), str(endDate))
             if (self.logger):
-                self.logger.debug("Wind Speed SQL: %s" % (spd_sql))
+                self.logger.debug("Wind Speed SQL: %s %s" % (sql, spd_params))
 
-            dir_sql = "SELECT m_date ,m_value FROM multi_obs\
-             WHERE sensor_id = %d AND\
-             (m_date >= '%s' AND \
-             m_date < '%s' ) ORDER BY m_date" \
-                      % (windDirId, startDate, endDate)
+            dir_params = (windDirId, str(startDate), str(endDate))
             if (self.logger):
-                self.logger.debug("Wind Dir SQL: %s" % (dir_sql))
+                self.logger.debug("Wind Dir SQL: %s %s" % (sql, dir_params))
             try:
                 windSpdCursor = self.DB.cursor()
-                windSpdCursor.execute(spd_sql)
+                windSpdCursor.execute(sql, spd_params)
                 windDirCursor = self.DB.cursor()
-                windDirCursor.execute(dir_sql)
+                windDirCursor.execute(sql, dir_params)
             except sqlite3.Error as e:
                 if self.logger:
                     self.logger.exception(e)
@@ -420,6 +416,30 @@ class wqDB(xeniaSQLite):
                     self.logger.error("Error platform: %s sensor: %s(%s) not added" % (
                         platform_name, obs_info['obs_name'], obs_info['uom_name']))
 
+    """
+    Function: buildMinimalPlatforms
+    Purpose: Provisions many platforms at once, inserting the missing organizations, platforms, types and sensors
+    set-wise in one transaction instead of the per sensor exists/add calls of buildMinimalPlatform.
+    Parameters:
+      platform_specs is a list of dictionaries with platform_handle and an observations list in the form
+        buildMinimalPlatform takes.
+    Returns:
+      A dictionary keyed on (obs_name, uom_name, platform_handle, s_order) of (sensor_id, m_type_id).
+    """
+
+    def buildMinimalPlatforms(self, platform_specs):
+        from .xeniaSQLiteAlchemy import xeniaAlchemy as sl_xeniaAlchemy
+
+        # The provisioning runs on its own connection, commit so ours is not holding the database lock.
+        self.DB.commit()
+        db = sl_xeniaAlchemy(type(self).__name__)
+        if not db.connect_sqlite_db(self.dbFilePath):
+            raise Exception("Unable to connect to database")
+        try:
+            return db.provision_platforms(platform_specs)
+        finally:
+            db.disconnect()
+
     """
     Function: addMeasurement
     Purpose: Adds a new entry into the multi_obs table.
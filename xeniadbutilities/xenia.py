@@ -13,6 +13,11 @@ parameter is not provided, one is created using the current localtime.
 import time
 import sqlite3
 from collections import defaultdict
+from .sqlite_profiles import apply_sqlite_profile
+
+# Floats were written with %f, so bound floats are rounded to the same number of decimals to keep matching the rows
+# already stored.
+FLOAT_PRECISION = 6
 
 
 class recursivedefaultdict(defaultdict):
@@ -106,8 +111,8 @@ class dbXenia(object):
             return (self.dbConnection.connect(None, user, passwd, host, dbName))
         return (False)
 
-    def executeQuery(self, sql):
-        return (self.dbConnection.executeQuery(sql))
+    def executeQuery(self, sql, params=None):
+        return (self.dbConnection.executeQuery(sql, params))
 
 
 class xeniaDB:
@@ -165,8 +170,8 @@ class xeniaDB:
 
     def loadSpatiaLiteLib(self, spatiaLiteLibFile):
         self.DB.enable_load_extension(True)
-        sql = 'SELECT load_extension("%s");' % (spatiaLiteLibFile)
-        cursor = self.executeQuery(sql)
+        sql = "SELECT load_extension(?);"
+        cursor = self.executeQuery(sql, (spatiaLiteLibFile,))
         if (cursor != None):
             return (True)
         return (False)
@@ -197,10 +202,10 @@ class xeniaDB:
               "left join m_scalar_type on m_scalar_type.row_id=m_type.m_scalar_type_id " \
               "left join obs_type on obs_type.row_id=m_scalar_type.obs_type_id " \
               "left join uom_type on uom_type.row_id=m_scalar_type.uom_type_id " \
-              "WHERE platform.platform_handle='%s' AND obs_type.standard_name='%s' AND uom_type.standard_name='%s' AND sensor.s_order=%d" \
-              % (platform, obsName, uom, sOrder)
+              "WHERE platform.platform_handle=? AND obs_type.standard_name=? AND uom_type.standard_name=? " \
+              "AND sensor.s_order=?"
         try:
-            dbCursor = self.executeQuery(sql)
+            dbCursor = self.executeQuery(sql, (platform, obsName, uom, sOrder))
             if (dbCursor != None):
                 row = dbCursor.fetchone()
                 mType = row[0]
@@ -227,12 +232,13 @@ class xeniaDB:
     if what we are looking for, for example a platform, exists in the table.
     Parameters:
       sql is the string containing the SQL statement.
+      params, if provided, are the values bound to the statement's ? markers.
     Returns:
       If found, the row_id, -1 if not found, or None if an error occured.
     """
 
-    def rowidExists(self, sql):
-        dbCursor = self.executeQuery(sql)
+    def rowidExists(self, sql, params=None):
+        dbCursor = self.executeQuery(sql, params)
         if (dbCursor != None):
             row = dbCursor.fetchone()
             if (row != None):
@@ -253,8 +259,8 @@ class xeniaDB:
 
     def obsTypeExists(self, obsName):
         # Does the observation exist in the obs_type table?
-        sql = "SELECT row_id FROM obs_type WHERE standard_name = '%s';" % (obsName)
-        return (self.rowidExists(sql))
+        sql = "SELECT row_id FROM obs_type WHERE standard_name = ?;"
+        return (self.rowidExists(sql, (obsName,)))
 
     """
     Function: addObsType
@@ -266,8 +272,8 @@ class xeniaDB:
     """
 
     def addObsType(self, obsName):
-        sql = "INSERT INTO obs_type (standard_name) VALUES ('%s');" % (obsName)
-        dbCursor = self.executeQuery(sql)
+        sql = "INSERT INTO obs_type (standard_name) VALUES (?);"
+        dbCursor = self.executeQuery(sql, (obsName,))
         if (dbCursor != None):
             if (self.commit()):
                 return (self.obsTypeExists(obsName))
@@ -285,8 +291,8 @@ class xeniaDB:
 
     def uomTypeExists(self, uom):
         # Check if our UOM exists.
-        sql = "SELECT row_id FROM uom_type WHERE standard_name = '%s';" % (uom)
-        return (self.rowidExists(sql))
+        sql = "SELECT row_id FROM uom_type WHERE standard_name = ?;"
+        return (self.rowidExists(sql, (uom,)))
 
     """
     Function: addUOMType
@@ -299,8 +305,8 @@ class xeniaDB:
     """
 
     def addUOMType(self, uom):
-        sql = "INSERT INTO uom_type (standard_name) VALUES ('%s');" % (uom)
-        dbCursor = self.executeQuery(sql)
+        sql = "INSERT INTO uom_type (standard_name) VALUES (?);"
+        dbCursor = self.executeQuery(sql, (uom,))
         if (dbCursor != None):
             if (self.commit()):
                 return (self.uomTypeExists(uom))
@@ -320,8 +326,8 @@ class xeniaDB:
     """
 
     def scalarTypeExists(self, obsTypeID, uomTypeID):
-        sql = "SELECT row_id FROM m_scalar_type WHERE obs_type_id = %d AND uom_type_id = %d;" % (obsTypeID, uomTypeID)
-        return (self.rowidExists(sql))
+        sql = "SELECT row_id FROM m_scalar_type WHERE obs_type_id = ? AND uom_type_id = ?;"
+        return (self.rowidExists(sql, (int(obsTypeID), int(uomTypeID))))
 
     """
     Function: addScalarType
@@ -337,8 +343,8 @@ class xeniaDB:
     """
 
     def addScalarType(self, obsTypeID, uomTypeID):
-        sql = "INSERT INTO m_scalar_type (obs_type_id,uom_type_id) VALUES (%d,%d);" % (obsTypeID, uomTypeID)
-        dbCursor = self.executeQuery(sql)
+        sql = "INSERT INTO m_scalar_type (obs_type_id,uom_type_id) VALUES (?,?);"
+        dbCursor = self.executeQuery(sql, (int(obsTypeID), int(uomTypeID)))
         if (dbCursor != None):
             if (self.commit()):
                 return (self.scalarTypeExists(obsTypeID, uomTypeID))
@@ -355,8 +361,8 @@ class xeniaDB:
     """
 
     def mTypeExists(self, scalarID):
-        sql = "SELECT row_id FROM m_type WHERE m_scalar_type_id=%d;" % (scalarID)
-        return (self.rowidExists(sql))
+        sql = "SELECT row_id FROM m_type WHERE m_scalar_type_id=?;"
+        return (self.rowidExists(sql, (int(scalarID),)))
 
     """
     Function: addMType
@@ -371,8 +377,8 @@ class xeniaDB:
     """
 
     def addMType(self, scalarID):
-        sql = "INSERT INTO m_type (m_scalar_type_id) VALUES (%d)" % (scalarID)
-        dbCursor = self.executeQuery(sql)
+        sql = "INSERT INTO m_type (m_scalar_type_id) VALUES (?)"
+        dbCursor = self.executeQuery(sql, (int(scalarID),))
         if (dbCursor != None):
             if (self.commit()):
                 return (self.mTypeExists(scalarID))
@@ -399,9 +405,9 @@ class xeniaDB:
               "left join obs_type on obs_type.row_id=m_scalar_type.obs_type_id " \
               "left join uom_type on uom_type.row_id=m_scalar_type.uom_type_id " \
               "WHERE " \
-              "sensor.s_order=%d AND platform.platform_handle='%s' AND obs_type.standard_name='%s' AND uom_type.standard_name='%s'" \
-              % (sOrder, platform, obsName, uom)
-        return (self.rowidExists(sql))
+              "sensor.s_order=? AND platform.platform_handle=? AND obs_type.standard_name=? " \
+              "AND uom_type.standard_name=?"
+        return (self.rowidExists(sql, (int(sOrder), platform, obsName, uom)))
 
     """
     Function: addSensor
@@ -491,9 +497,9 @@ class xeniaDB:
         if (platformID != None):
             if (platformID != -1):
                 sql = "INSERT INTO sensor (platform_id,m_type_id,short_name,fixed_z,active,s_order) " \
-                      "VALUES(%d,%d,'%s',%d,%d,%d)" \
-                      % (platformID, mTypeID, obsName, fixedZ, active, sOrder)
-                dbCursor = self.executeQuery(sql)
+                      "VALUES(?,?,?,?,?,?)"
+                dbCursor = self.executeQuery(sql, (int(platformID), int(mTypeID), obsName, int(fixedZ), int(active),
+                                                   int(sOrder)))
                 if (dbCursor != None):
                     self.commit()
                     return (self.sensorExists(obsName, uom, platformHandle, sOrder))
@@ -512,8 +518,8 @@ class xeniaDB:
     """
 
     def organizationExists(self, orgName):
-        sql = "SELECT row_id FROM organization WHERE short_name = '%s';" % (orgName)
-        return (self.rowidExists(sql))
+        sql = "SELECT row_id FROM organization WHERE short_name = ?;"
+        return (self.rowidExists(sql, (orgName,)))
 
     """
     Function: addOrganization
@@ -534,22 +540,19 @@ class xeniaDB:
     """
 
     def addOrganization(self, orgInfo):
-        columns = ''
-        values = ''
+        columns = []
+        values = []
         for column in orgInfo:
-            if (len(columns)):
-                columns += ","
-            columns += column
-            if (len(values)):
-                values += ","
+            columns.append(column)
             if (column == 'active'):
-                values += ("%d" % (int(orgInfo[column])))
+                values.append(int(orgInfo[column]))
             else:
-                values += ("'%s'" % (orgInfo[column]))
+                values.append(orgInfo[column])
 
         if (len(columns)):
-            sql = "INSERT INTO organization (%s) VALUES (%s)" % (columns, values)
-            dbCursor = self.executeQuery(sql)
+            # Column names cannot be bound, only the values are.
+            sql = "INSERT INTO organization (%s) VALUES (%s)" % (",".join(columns), ",".join("?" * len(columns)))
+            dbCursor = self.executeQuery(sql, values)
             # If we successfully added the org, let's get it's row_id.
             if (dbCursor != None):
                 try:
@@ -581,8 +584,8 @@ class xeniaDB:
     """
 
     def platformExists(self, platformHandle):
-        sql = "SELECT row_id FROM platform WHERE platform_handle = '%s'" % (platformHandle)
-        return (self.rowidExists(sql))
+        sql = "SELECT row_id FROM platform WHERE platform_handle = ?"
+        return (self.rowidExists(sql, (platformHandle,)))
 
     """
     Function: addPlatform
@@ -611,24 +614,21 @@ class xeniaDB:
     """
 
     def addPlatform(self, platformInfo):
-        columns = ''
-        values = ''
+        columns = []
+        values = []
         for column in platformInfo:
-            if (len(columns)):
-                columns += ","
-            columns += column
-            if (len(values)):
-                values += ","
+            columns.append(column)
             if (column == 'active' or column == 'organization_id'):
-                values += ("%d" % (int(platformInfo[column])))
+                values.append(int(platformInfo[column]))
             elif (column == 'fixed_latitude' or column == 'fixed_longitude'):
-                values += ("%f" % (float(platformInfo[column])))
+                values.append(round(float(platformInfo[column]), FLOAT_PRECISION))
             else:
-                values += ("'%s'" % (platformInfo[column]))
+                values.append(platformInfo[column])
 
         if (len(columns)):
-            sql = "INSERT INTO platform (%s) VALUES (%s)" % (columns, values)
-            dbCursor = self.executeQuery(sql)
+            # Column names cannot be bound, only the values are.
+            sql = "INSERT INTO platform (%s) VALUES (%s)" % (",".join(columns), ",".join("?" * len(columns)))
+            dbCursor = self.executeQuery(sql, values)
             # If we successfully added the org, let's get it's row_id.
             if (dbCursor != None):
                 try:
@@ -657,9 +657,10 @@ class xeniaDB:
 
     def updateMeasurement(self, mTypeID, sensorID, platformHandle, date, lat, lon, z, mValues, sOrder=1,
                           autoCommit=True, rowEntryDate=None, updateDate=None):
-        sql = "SELECT row_id FROM multi_obs WHERE m_date='%s' AND sensor_id=%d AND m_type_id=%d AND platform_handle='%s' AND m_lat=%f AND m_lon=%f" \
-              % (date, sensorID, mTypeID, platformHandle, lat, lon)
-        dbCursor = self.executeQuery(sql)
+        sql = "SELECT row_id FROM multi_obs WHERE m_date=? AND sensor_id=? AND m_type_id=? AND platform_handle=? " \
+              "AND m_lat=? AND m_lon=?"
+        dbCursor = self.executeQuery(sql, (str(date), int(sensorID), int(mTypeID), platformHandle,
+                                           round(lat, FLOAT_PRECISION), round(lon, FLOAT_PRECISION)))
         # Entry exists, so let's update it.
         addRec = True
         if (dbCursor != None):
@@ -671,17 +672,18 @@ class xeniaDB:
             if (addRec == False):
                 # There are multiple m_value columns in multi_obs. The values parameter is a list whose index
                 # represents the m_value column to be populated.
-                m_values = ""
+                m_values = []
                 valID = 1
                 for value in mValues:
                     if (valID != 1):
-                        m_values += (",m_value_%d=%f" % (valID, value))
+                        m_values.append("m_value_%d=?" % (valID))
                     else:
-                        m_values += "m_value=%f" % (value)
+                        m_values.append("m_value=?")
                     valID += 1
-                sql = "UPDATE multi_obs SET %s, row_update_date='%s' WHERE row_id=%d" \
-                      % (m_values, updateDate, row['row_id'])
-                dbCursor = self.executeQuery(sql)
+                sql = "UPDATE multi_obs SET %s, row_update_date=? WHERE row_id=?" % (",".join(m_values))
+                params = [round(value, FLOAT_PRECISION) for value in mValues]
+                params.extend((str(updateDate), row['row_id']))
+                dbCursor = self.executeQuery(sql, params)
                 if (dbCursor != None):
                     if (autoCommit):
                         return (self.commit())
@@ -705,7 +707,8 @@ class xeniaDB:
         columns = "platform_handle,sensor_id,m_type_id,m_date,m_lat,m_lon,m_z,row_entry_date"
         if (rowEntryDate == None):
             rowEntryDate = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-        values = "'%s',%d,%d,'%s',%f,%f,%f,'%s'" % (platformHandle, sensorID, mTypeID, date, lat, lon, z, rowEntryDate)
+        values = [platformHandle, int(sensorID), int(mTypeID), str(date), round(lat, FLOAT_PRECISION),
+                  round(lon, FLOAT_PRECISION), round(z, FLOAT_PRECISION), str(rowEntryDate)]
         # There are multiple m_value columns in multi_obs. The values parameter is a list whose index
         # represents the m_value column to be populated.
         valID = 1
@@ -714,10 +717,11 @@ class xeniaDB:
                 columns += (",m_value_%d" % (valID))
             else:
                 columns += ",m_value"
-            values += (",%f" % (value))
+            values.append(round(value, FLOAT_PRECISION))
             valID += 1
-        sql = "INSERT INTO multi_obs (%s) VALUES (%s)" % (columns, values)
-        dbCursor = self.executeQuery(sql)
+        # The statement text only changes with the number of m_values, so it is reused from the statement cache.
+        sql = "INSERT INTO multi_obs (%s) VALUES (%s)" % (columns, ",".join("?" * len(values)))
+        dbCursor = self.executeQuery(sql, values)
         if (dbCursor != None):
             if (autoCommit):
                 return (self.commit())
@@ -746,8 +750,8 @@ class xeniaDB:
     def getPlatformInfo(self, platformHandle):
         id = self.platformExists(platformHandle)
         if (id != -1 and id != None):
-            sql = "SELECT * FROM platform WHERE platform_handle = '%s';" % (platformHandle)
-            return (self.executeQuery(sql))
+            sql = "SELECT * FROM platform WHERE platform_handle = ?;"
+            return (self.executeQuery(sql, (platformHandle,)))
         return (None)
 
     def getDataForSensorID(self, sensorID, startDate, endDate, timeZoneShift):
@@ -806,17 +810,25 @@ class xeniaSQLite(xeniaDB):
       passwd not used
       host not used
       dbName not used
+      profile is the name of a sqlite_profiles.SQLITE_PROFILES entry whose PRAGMAs are applied to the connection.
+      cached_statements, if provided, is the number of prepared statements sqlite3 keeps for reuse, the default is
+        128. The queries bind their values, so each distinct query text only has to be prepared once.
     Return: 
       True if we successfully connected, otherwise false. Any error info
       is stored in  self.lastErrorMsg
     """
 
-    def connect(self, dbFilePath=None, user=None, passwd=None, host=None, dbName=None):
+    def connect(self, dbFilePath=None, user=None, passwd=None, host=None, dbName=None, profile=None,
+                cached_statements=None):
         self.dbFilePath = dbFilePath
         try:
-            self.DB = sqlite3.connect(self.dbFilePath)
+            if cached_statements is not None:
+                self.DB = sqlite3.connect(self.dbFilePath, cached_statements=cached_statements)
+            else:
+                self.DB = sqlite3.connect(self.dbFilePath)
             # This enables the ability to manipulate rows with the column name instead of an index.
             self.DB.row_factory = sqlite3.Row
+            apply_sqlite_profile(self.DB, profile)
             return (True)
         except Exception as E:
             self.lastErrorMsg = str(E)
@@ -828,14 +840,18 @@ class xeniaSQLite(xeniaDB):
     Purpose: Executes the sql statement passed in.
     Parameters: 
       sqlQuery is a string containing the query to execute.
+      params, if provided, are the values bound to the query's ? markers.
     Return: 
       If successfull, a cursor is returned, otherwise None is returned.
     """
 
-    def executeQuery(self, sqlQuery):
+    def executeQuery(self, sqlQuery, params=None):
         try:
             dbCursor = self.DB.cursor()
-            dbCursor.execute(sqlQuery)
+            if params is None:
+                dbCursor.execute(sqlQuery)
+            else:
+                dbCursor.execute(sqlQuery, params)
             return (dbCursor)
         except sqlite3.Error as e:
             self.lastErrorMsg = 'SQL ERROR: ' + e.args[0] + ' SQL: ' + sqlQuery
@@ -850,12 +866,13 @@ class xeniaSQLite(xeniaDB):
         sql = "SELECT multi_obs.m_date,multi_obs.m_value        \
                   FROM multi_obs           \
                   WHERE                    \
-                  multi_obs.sensor_id = %d                              AND   \
-                  ( m_date >= strftime( '%%Y-%%m-%%dT%%H:00:00',datetime('%s','%d hours') )   AND  \
-                  m_date < strftime( '%%Y-%%m-%%dT%%H:00:00', datetime('%s','%d hours') ) ) \
-                  ORDER BY multi_obs.m_date ASC;" % (sensorID, startDate, timeZoneShift, endDate, timeZoneShift);
+                  multi_obs.sensor_id = ?                              AND   \
+                  ( m_date >= strftime( '%Y-%m-%dT%H:00:00',datetime(?,?) )   AND  \
+                  m_date < strftime( '%Y-%m-%dT%H:00:00', datetime(?,?) ) ) \
+                  ORDER BY multi_obs.m_date ASC;"
+        shift = '%d hours' % (timeZoneShift)
         try:
-            dbCursor = self.executeQuery(sql)
+            dbCursor = self.executeQuery(sql, (int(sensorID), str(startDate), shift, str(endDate), shift))
             for row in dbCursor:
                 data.append((row[0], row[1]))
             dbCursor.close()
@@ -870,8 +887,11 @@ class xeniaSQLite(xeniaDB):
 
         # Do we want to query from a datetime of now back lastNHours?
         dateOffset = ''
+        params = []
         if (lastNHours != None):
-            dateOffset = "m_date > strftime('%%Y-%%m-%%dT%%H:%%M:%%S', 'now','-%d hours') AND" % (lastNHours)
+            dateOffset = "m_date > strftime('%Y-%m-%dT%H:%M:%S', 'now',?) AND"
+            params.append('-%d hours' % (lastNHours))
+        params.append(platform)
 
         sql = "SELECT m_date \
           ,multi_obs.platform_handle \
@@ -888,11 +908,11 @@ class xeniaSQLite(xeniaDB):
           left join m_scalar_type on m_scalar_type.row_id=m_type.m_scalar_type_id \
           left join obs_type on obs_type.row_id=m_scalar_type.obs_type_id \
           left join uom_type on uom_type.row_id=m_scalar_type.uom_type_id \
-          WHERE %s multi_obs.platform_handle = '%s' AND qc_level IS NULL AND sensor.row_id IS NOT NULL\
+          WHERE %s multi_obs.platform_handle = ? AND qc_level IS NULL AND sensor.row_id IS NOT NULL\
           ORDER BY m_date DESC" \
-              % (dateOffset, platform)
+              % (dateOffset)
         try:
-            dbCursor = self.executeQuery(sql)
+            dbCursor = self.executeQuery(sql, params)
             return (dbCursor)
         except sqlite3.Error as e:
             self.lastErrorMsg = 'SQL ERROR: ' + e.args[0] + ' SQL: ' + sql
@@ -914,6 +934,25 @@ class xeniaPostGres(xeniaDB):
     def __init__(self):
         xeniaDB.__init__(self)
         self.dbType = dbTypes.PostGRES
+        # The ? marker queries converted to psycopg2's %s markers, see pyformatSQL.
+        self.pyformatStatements = {}
+
+    """
+    Function: pyformatSQL
+    Purpose: The xeniaDB queries are written with sqlite3's ? markers. psycopg2 uses %s markers and needs any literal
+    % doubled, so the query is converted once per distinct query text.
+    Parameters:
+      sqlQuery is the query with ? markers. It must not contain a literal ?.
+    Return:
+      The query with %s markers.
+    """
+
+    def pyformatSQL(self, sqlQuery):
+        pyformatQuery = self.pyformatStatements.get(sqlQuery)
+        if (pyformatQuery == None):
+            pyformatQuery = sqlQuery.replace('%', '%%').replace('?', '%s')
+            self.pyformatStatements[sqlQuery] = pyformatQuery
+        return (pyformatQuery)
 
     """
     Function: connect
@@ -958,14 +997,18 @@ class xeniaPostGres(xeniaDB):
     Purpose: Executes the sql statement passed in.
     Parameters: 
       sqlQuery is a string containing the query to execute.
+      params, if provided, are the values bound to the query's ? markers.
     Return: 
       If successfull, a cursor is returned, otherwise None is returned.
     """
 
-    def executeQuery(self, sqlQuery):
+    def executeQuery(self, sqlQuery, params=None):
         try:
             dbCursor = self.DB.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            dbCursor.execute(sqlQuery)
+            if params is None:
+                dbCursor.execute(sqlQuery)
+            else:
+                dbCursor.execute(self.pyformatSQL(sqlQuery), params)
             return (dbCursor)
         except psycopg2.Error as E:
             if (E.pgerror != None):
@@ -980,9 +1023,8 @@ class xeniaPostGres(xeniaDB):
         return (None)
 
     def getCurrentPlatformStatus(self, platformHandle):
-        sql = "SELECT active FROM platform WHERE platform_handle='%s';" \
-              % (platformHandle)
-        dbCursor = self.executeQuery(sql)
+        sql = "SELECT active FROM platform WHERE platform_handle=?;"
+        dbCursor = self.executeQuery(sql, (platformHandle,))
         if (dbCursor != None):
             row = dbCursor.fetchone()
             if (row != None):
@@ -991,8 +1033,8 @@ class xeniaPostGres(xeniaDB):
 
     def setPlatformStatus(self, platformHandle, status):
         # Get the platform id and the organization id
-        sql = "SELECT row_id,organization_id FROM platform WHERE platform_handle='%s';" % (platformHandle)
-        dbCursor = self.executeQuery(sql)
+        sql = "SELECT row_id,organization_id FROM platform WHERE platform_handle=?;"
+        dbCursor = self.executeQuery(sql, (platformHandle,))
         if (dbCursor != None):
             row = dbCursor.fetchone()
             if (row != None):
@@ -1010,9 +1052,9 @@ class xeniaPostGres(xeniaDB):
                     # Update the platform_status table to reflect the new status.
                     sql = "INSERT INTO platform_status " \
                           "(platform_id,organization_id,row_entry_date,begin_date,status,platform_handle) " \
-                          "values (%d,%d,'%s','%s',%d,'%s');" \
-                          % (platformId, OrgId, rowEntryDate, gmtDate, status, platformHandle)
-                    statusCursor = self.executeQuery(sql)
+                          "values (?,?,?,?,?,?);"
+                    statusCursor = self.executeQuery(sql, (platformId, OrgId, rowEntryDate, gmtDate, int(status),
+                                                           platformHandle))
                     if (statusCursor == None):
                         return (False)
                     self.commit()
@@ -1020,9 +1062,8 @@ class xeniaPostGres(xeniaDB):
                     # Now add entry into the platform_status_archive table
                     sql = "INSERT INTO platform_status_archive " \
                           "(platform_id,organization_id,row_entry_date,begin_date,status) " \
-                          "values(%d,%d,'%s','%s',%d);" \
-                          % (platformId, OrgId, rowEntryDate, gmtDate, status)
-                    statusCursor = self.executeQuery(sql)
+                          "values(?,?,?,?,?);"
+                    statusCursor = self.executeQuery(sql, (platformId, OrgId, rowEntryDate, gmtDate, int(status)))
                     if (statusCursor == None):
                         return (False)
                     self.commit()
@@ -1031,9 +1072,9 @@ class xeniaPostGres(xeniaDB):
                 # table then add teh end date into the platform_status_field
                 else:
                     # Get current platform_status info to move over to the archive.
-                    sql = "SELECT author,reason FROM platform_status WHERE platform_id=%d;" % (platformId)
+                    sql = "SELECT author,reason FROM platform_status WHERE platform_id=?;"
 
-                    statusCursor = self.executeQuery(sql)
+                    statusCursor = self.executeQuery(sql, (platformId,))
                     if (statusCursor == None):
                         return (False)
                     row = statusCursor.fetchone()
@@ -1044,26 +1085,24 @@ class xeniaPostGres(xeniaDB):
                         reason = row['reason']
                     statusCursor.close()
 
-                    sql = "DELETE FROM platform_status WHERE platform_id=%d;" % (platformId)
-                    statusCursor = self.executeQuery(sql)
+                    sql = "DELETE FROM platform_status WHERE platform_id=?;"
+                    statusCursor = self.executeQuery(sql, (platformId,))
                     if (statusCursor == None):
                         return (False)
                     self.commit()
                     statusCursor.close()
 
-                    sql = "UPDATE platform_status_archive SET end_date='%s',row_update_date='%s',author='%s',reason='%s'" \
-                          "WHERE platform_id=%d AND end_date IS NULL;" \
-                          % (gmtDate, rowEntryDate, author, reason, platformId)
-                    statusCursor = self.executeQuery(sql)
+                    sql = "UPDATE platform_status_archive SET end_date=?,row_update_date=?,author=?,reason=? " \
+                          "WHERE platform_id=? AND end_date IS NULL;"
+                    statusCursor = self.executeQuery(sql, (gmtDate, rowEntryDate, author, reason, platformId))
                     if (statusCursor == None):
                         return (False)
                     self.commit()
                     statusCursor.close()
 
                 # Now update the active field in the platform table.
-                sql = "UPDATE platform SET active=%d WHERE platform_handle='%s';" \
-                      % (status, platformHandle)
-                statusCursor = self.executeQuery(sql)
+                sql = "UPDATE platform SET active=? WHERE platform_handle=?;"
+                statusCursor = self.executeQuery(sql, (int(status), platformHandle))
                 if (statusCursor == None):
                     return (False)
                 self.commit()
@@ -1076,9 +1115,8 @@ class xeniaPostGres(xeniaDB):
     def getPlatformStatus(self, platformHandle):
         status = None
         sql = "SELECT  to_char(begin_date,'YYYY-MM-DD HH24:MM:SS') as begin_date,reason FROM platform_status " \
-              "WHERE platform_handle='%s' AND end_date IS NULL;" \
-              % (platformHandle)
-        dbCursor = self.executeQuery(sql)
+              "WHERE platform_handle=? AND end_date IS NULL;"
+        dbCursor = self.executeQuery(sql, (platformHandle,))
         if (dbCursor != None):
             row = dbCursor.fetchone()
             if (row != None):
@@ -1094,9 +1132,11 @@ class xeniaPostGres(xeniaDB):
 
         # Do we want to query from a datetime of now back lastNHours?
         dateOffset = ''
+        params = []
         if (lastNHours != None):
-            dateOffset = "m_date >  date_trunc('hour',( SELECT timezone('UTC', now()-interval '%d hours' ) ) ) AND" % (
-                lastNHours)
+            dateOffset = "m_date >  date_trunc('hour',( SELECT timezone('UTC', now()-(? * interval '1 hour') ) ) ) AND"
+            params.append(int(lastNHours))
+        params.append(platform)
 
         sql = "SELECT m_date \
           ,multi_obs.platform_handle \
@@ -1113,11 +1153,11 @@ class xeniaPostGres(xeniaDB):
           left join m_scalar_type on m_scalar_type.row_id=m_type.m_scalar_type_id \
           left join obs_type on obs_type.row_id=m_scalar_type.obs_type_id \
           left join uom_type on uom_type.row_id=m_scalar_type.uom_type_id \
-          WHERE %s multi_obs.platform_handle = '%s' AND qc_level IS NULL AND sensor.row_id IS NOT NULL\
+          WHERE %s multi_obs.platform_handle = ? AND qc_level IS NULL AND sensor.row_id IS NOT NULL\
           ORDER BY m_date DESC" \
-              % (dateOffset, platform)
+              % (dateOffset)
         try:
-            dbCursor = self.executeQuery(sql)
+            dbCursor = self.executeQuery(sql, params)
             return (dbCursor)
         except Exception as E:
             self.lastErrorMsg = str(E)
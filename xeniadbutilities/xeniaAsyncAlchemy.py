@@ -0,0 +1,130 @@
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import logging
+
+from . import xeniaSQLAlchemy
+from . import xeniaSQLiteAlchemy
+from .multi_obs_writer import build_multi_obs_insert, multi_obs_columns, multi_obs_params
+from .sqlite_profiles import apply_sqlite_profile
+
+
+class xeniaAsyncAlchemy:
+    """
+    Function: __init__
+    Purpose: asyncio counterpart of xeniaAlchemy built on SQLAlchemy's asyncio engine, so an event loop can write
+    observations and look up sensors without handing them to a saver process. Requires the aiosqlite driver for
+    SQLite and asyncpg for PostgreSQL.
+    """
+
+    def __init__(self, logger_name=""):
+        self.dbEngine = None
+        self.session_factory = None
+        self._models = None
+        self._insert_stmts = {}
+        self.logger = logging.getLogger(logger_name)
+
+    async def connect_sqlite_db(self, sqlite_filename, print_sql=False, profile=None):
+        connection_string = f"sqlite+aiosqlite:///{sqlite_filename}"
+        return await self.connect(connection_string, print_sql, profile)
+
+    async def connect_postgres_db(self, db_user, db_pwd, db_host, db_name, print_sql=False):
+        if db_host is not None and len(db_host):
+            connection_string = f"postgresql+asyncpg://{db_user}:{db_pwd}@{db_host}/{db_name}"
+        else:
+            connection_string = f"postgresql+asyncpg://{db_user}:{db_pwd}@/{db_name}"
+        return await self.connect(connection_string, print_sql)
+
+    """
+    Function: connect
+    Purpose: Creates the async engine and checks the database can be reached.
+    Parameters:
+      connection_string is an async SQLAlchemy URL, for instance sqlite+aiosqlite:///file.db.
+      profile is the sqlite_profiles.SQLITE_PROFILES entry applied to SQLite connections.
+    Returns:
+      True if we connected, otherwise False.
+    """
+
+    async def connect(self, connection_string, print_sql=False, profile=None):
+        try:
+            self.dbEngine = create_async_engine(connection_string, echo=print_sql)
+            if self.dbEngine.dialect.name == 'postgresql':
+                self._models = xeniaSQLAlchemy
+            else:
+                self._models = xeniaSQLiteAlchemy
+                if profile is not None:
+                    event.listen(self.dbEngine.sync_engine, 'connect',
+                                 lambda dbapi_connection, connection_record: apply_sqlite_profile(dbapi_connection,
+                                                                                                  profile))
+            self.session_factory = async_sessionmaker(self.dbEngine, expire_on_commit=False)
+            async with self.dbEngine.connect():
+                pass
+            return True
+        except Exception as e:
+            self.logger.exception(e)
+        return False
+
+    async def disconnect(self):
+        await self.dbEngine.dispose()
+
+    """
+    Function: add_observations
+    Purpose: Inserts the observations with a single executemany inside one transaction.
+    Parameters:
+      records is a list of multi_obs objects or tuples in multi_obs_writer.MULTI_OBS_COLUMNS order.
+      on_conflict is None, 'do_nothing' or 'do_update', see multi_obs_writer.build_multi_obs_insert.
+      conflict_columns are the unique columns 'do_update' targets.
+    Returns:
+      The number of records inserted.
+    """
+
+    async def add_observations(self, records, on_conflict=None, conflict_columns=None):
+        if not records:
+            return 0
+        if conflict_columns is not None:
+            conflict_columns = tuple(conflict_columns)
+        stmt_key = (on_conflict, conflict_columns)
+        if stmt_key not in self._insert_stmts:
+            self._insert_stmts[stmt_key] = build_multi_obs_insert(self._models.multi_obs.__table__,
+                                                                  self.dbEngine.dialect.name,
+                                                                  on_conflict,
+                                                                  conflict_columns)
+        columns = multi_obs_columns(self._models.multi_obs.__table__)
+        params = [multi_obs_params(rec, columns) for rec in records]
+        async with self.dbEngine.begin() as connection:
+            result = await connection.execute(self._insert_stmts[stmt_key], params)
+        if result.rowcount is not None and result.rowcount >= 0:
+            return result.rowcount
+        return len(params)
+
+    async def platformExists(self, platformHandle):
+        platform = self._models.platform
+        async with self.session_factory() as session:
+            return await session.scalar(select(platform.row_id)
+                                        .where(platform.platform_handle == platformHandle))
+
+    """
+    Function: sensorExists
+    Purpose: Checks to see if the passed in obsName on the platform.
+    Parameters:
+      obsName is the sensor(observation) we are testing for.
+      uom is the unit of measurement of the sensor.
+      platformHandle is the platform on which we search for the obsName.
+      sOrder, if provided specifies the specific sensor if there are multiples of the same on a platform.
+    Returns:
+      The sensor id(row_id) if it exists, otherwise None.
+    """
+
+    async def sensorExists(self, obsName, uom, platformHandle, sOrder=1):
+        models = self._models
+        stmt = select(models.sensor.row_id) \
+            .join(models.platform, models.platform.row_id == models.sensor.platform_id) \
+            .join(models.m_type, models.m_type.row_id == models.sensor.m_type_id) \
+            .join(models.m_scalar_type, models.m_scalar_type.row_id == models.m_type.m_scalar_type_id) \
+            .join(models.obs_type, models.obs_type.row_id == models.m_scalar_type.obs_type_id) \
+            .join(models.uom_type, models.uom_type.row_id == models.m_scalar_type.uom_type_id) \
+            .where(models.sensor.s_order == sOrder) \
+            .where(models.platform.platform_handle == platformHandle) \
+            .where(models.obs_type.standard_name == obsName) \
+            .where(models.uom_type.standard_name == uom)
+        async with self.session_factory() as session:
+            return await session.scalar(stmt)
@@ -4,10 +4,11 @@ Date: 2013-01-02
 Function: xeniaAlchemy::obsTypeExists
 Changes: Fixed up variable name in except handler
 """
+import sys
 import time
 
 from sqlalchemy import Table, Column, Integer, String, MetaData, ForeignKey, DateTime, Float, func
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import ForeignKey
@@ -16,6 +17,14 @@ from sqlalchemy import exc
 from sqlalchemy.orm.exc import *
 # from geoalchemy import *
 from geoalchemy2 import Geometry
+from .sqlite_profiles import apply_sqlite_profile
+from .sensor_cache import SensorIdCache
+from .metadata_catalog import MetadataCatalog, metadata_fingerprint
+from .sensor_resolution import resolve_sensors
+from .platform_provisioning import provision_platforms
+from .row_id_allocator import RowIdAllocator
+from .engine_registry import get_engine
+from .lookup_statements import lookup_statements, execute_lookup
 import logging.config
 
 Base = declarative_base()
@@ -328,29 +337,60 @@ class xeniaAlchemy(object):
         self.dbEngine = None
         self.metadata = None
         self.session = None
+        self._owns_engine = False
+        self._connection = None
+        # Prebuilt statements for the *Exists lookups.
+        self._lookups = lookup_statements(sys.modules[__name__])
+        # Sensor ids resolved by sensorExists or added by newSensor on this connection.
+        self.sensor_cache = SensorIdCache()
+        # metadata_catalog.MetadataCatalog, set by load_catalog().
+        self.catalog = None
+        # Hands out row_ids for the type tables, created on connect.
+        self.row_id_allocator = None
         self.logger = logger
         if logger:
             self.logger = logging.getLogger(__name__)
 
-    def connectDB(self, databaseType, dbUser, dbPwd, dbHost, dbName, printSQL=False):
+    """
+    Function: connectDB
+    Purpose: Connects to the database.
+    Parameters:
+      databaseType is the SQLAlchemy dialect, for instance "postgresql" or "sqlite". For sqlite, dbName is the
+        database file.
+      sqliteProfile is the name of a sqlite_profiles.SQLITE_PROFILES entry applied to every connection when
+        databaseType is sqlite.
+      preloadCatalog, if True, loads the metadata catalog once connected, see load_catalog().
+      sharedEngine, if True, the engine comes from engine_registry and is shared with every other connection to the
+        same database in the process. If False the engine is created for this object and disposed by disconnect().
+      poolSize, maxOverflow and poolPrePing, if provided, are passed to the engine's connection pool.
+    """
+
+    def connectDB(self, databaseType, dbUser, dbPwd, dbHost, dbName, printSQL=False, sqliteProfile=None,
+                  preloadCatalog=False, sharedEngine=True, poolSize=None, maxOverflow=None, poolPrePing=None):
 
         try:
             # Connect to the database
-            if (dbHost != None and len(dbHost)):
+            if databaseType.startswith('sqlite'):
+                connectionString = "%s:///%s" % (databaseType, dbName)
+            elif (dbHost != None and len(dbHost)):
                 connectionString = "%s://%s:%s@%s/%s" % (databaseType, dbUser, dbPwd, dbHost, dbName)
             else:
                 connectionString = "%s://%s:%s@/%s" % (databaseType, dbUser, dbPwd, dbName)
 
-            self.dbEngine = create_engine(connectionString, echo=printSQL)
-
-            # metadata object is used to keep information such as datatypes for our table's columns.
-            self.metadata = MetaData()
-            self.metadata.bind = self.dbEngine
-
-            Session = sessionmaker(bind=self.dbEngine)
-            self.session = Session()
+            if not databaseType.startswith('sqlite'):
+                sqliteProfile = None
+            if sharedEngine:
+                engine = get_engine(connectionString, echo=printSQL, sqlite_profile=sqliteProfile,
+                                    pool_size=poolSize, max_overflow=maxOverflow, pool_pre_ping=poolPrePing)
+            else:
+                engine = create_engine(connectionString, echo=printSQL)
+                if sqliteProfile is not None:
+                    event.listen(engine, 'connect',
+                                 lambda dbapi_connection, connection_record: apply_sqlite_profile(dbapi_connection,
+                                                                                                  sqliteProfile))
 
-            self.connection = self.dbEngine.connect()
+            self.attach_engine(engine, preloadCatalog)
+            self._owns_engine = not sharedEngine
 
             return (True)
         except (exc.OperationalError, Exception) as e:
@@ -358,20 +398,79 @@ class xeniaAlchemy(object):
                 self.logger.exception(e)
         return (False)
 
+    """
+    Function: load_catalog
+    Purpose: Loads the metadata tables into a metadata_catalog.MetadataCatalog, available as self.catalog, so
+    platform, sensor and type lookups can be answered without a query each. The *Exists methods check the catalog
+    first and only query the database for rows it does not have. Rows added through addRec are added to it.
+    Parameters:
+      check_interval, if provided, is how many seconds the catalog is trusted before it checks the tables for
+        changes.
+    Returns:
+      The catalog.
+    """
+
+    def load_catalog(self, check_interval=None):
+        self.catalog = MetadataCatalog(self, sys.modules[__name__], check_interval)
+        return self.catalog
+
+    """
+    Function: attach_engine
+    Purpose: Uses an engine created elsewhere instead of creating one, so several xeniaAlchemy objects, or other code,
+    can share one engine and its connection pool. disconnect() leaves an attached engine open.
+    Parameters:
+      engine is the SQLAlchemy engine.
+      preload_catalog, if True, loads the metadata catalog, see load_catalog().
+    """
+
+    def attach_engine(self, engine, preload_catalog=False):
+        self.dbEngine = engine
+        self._owns_engine = False
+
+        # metadata object is used to keep information such as datatypes for our table's columns.
+        self.metadata = MetaData()
+        self.metadata.bind = self.dbEngine
+
+        Session = sessionmaker(bind=self.dbEngine)
+        self.session = Session()
+        self.sensor_cache = SensorIdCache()
+        self.row_id_allocator = RowIdAllocator(self.dbEngine)
+        self._connection = None
+
+        if preload_catalog:
+            self.load_catalog()
+        return True
+
+    """
+    Function: connection
+    Purpose: A Core connection from the engine, only checked out of the pool the first time it is used.
+    """
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = self.dbEngine.connect()
+        return self._connection
+
     def disconnect(self):
         self.session.close()
-        self.connection.close()
-        self.dbEngine.dispose()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._owns_engine:
+            self.dbEngine.dispose()
 
     """
     Function: platformExists  
     """
 
     def platformExists(self, platformHandle):
+        if self.catalog is not None:
+            row_id = self.catalog.platformExists(platformHandle)
+            if row_id is not None:
+                return row_id
         try:
-            platRec = self.session.query(platform.row_id) \
-                .filter(platform.platform_handle == platformHandle) \
-                .one()
+            platRec = execute_lookup(self.session, self._lookups['platform'], {'platform_handle': platformHandle})
             return (platRec.row_id)
         except NoResultFound as e:
             if (self.logger != None):
@@ -468,10 +567,12 @@ class xeniaAlchemy(object):
     """
 
     def organizationExists(self, organizationName):
+        if self.catalog is not None:
+            row_id = self.catalog.organizationExists(organizationName)
+            if row_id is not None:
+                return row_id
         try:
-            orgRec = self.session.query(organization.row_id) \
-                .filter(organization.short_name == organizationName) \
-                .one()
+            orgRec = execute_lookup(self.session, self._lookups['organization'], {'short_name': organizationName})
             return (orgRec.row_id)
         except NoResultFound as e:
             if (self.logger != None):
@@ -490,22 +591,25 @@ class xeniaAlchemy(object):
       sOrder, if provided specifies the specific sensor if there are multiples of the same on a platform.
     Returns:
       The sensor id(row_id) if it exists, -1 if it does not exists, or None if an error occured. If there was an error
-      lastErrorMsg can be checked for the error message.
+      lastErrorMsg can be checked for the error message. Found ids are served from sensor_cache after the first call.
     """
 
     def sensorExists(self, obsName, uom, platformHandle, sOrder=1):
+        cache_key = (obsName, uom, platformHandle, sOrder)
+        sensor_id = self.sensor_cache.get(cache_key)
+        if sensor_id is not None:
+            return sensor_id
+        if self.catalog is not None:
+            sensor_id = self.catalog.sensorExists(obsName, uom, platformHandle, sOrder)
+            if sensor_id is not None:
+                self.sensor_cache.put(cache_key, sensor_id)
+                return sensor_id
 
         try:
-            rec = self.session.query(sensor.row_id) \
-                .join(platform, platform.row_id == sensor.platform_id) \
-                .join(m_type, m_type.row_id == sensor.m_type_id) \
-                .join(m_scalar_type, m_scalar_type.row_id == m_type.m_scalar_type_id) \
-                .join(obs_type, obs_type.row_id == m_scalar_type.obs_type_id) \
-                .join(uom_type, uom_type.row_id == m_scalar_type.uom_type_id) \
-                .filter(sensor.s_order == sOrder) \
-                .filter(platform.platform_handle == platformHandle) \
-                .filter(obs_type.standard_name == obsName) \
-                .filter(uom_type.standard_name == uom).one()
+            rec = execute_lookup(self.session, self._lookups['sensor'],
+                                 {'obs_name': obsName, 'uom': uom, 'platform_handle': platformHandle,
+                                  's_order': sOrder})
+            self.sensor_cache.put(cache_key, rec.row_id)
             return (rec.row_id)
         except NoResultFound as e:
             if (self.logger != None):
@@ -562,23 +666,50 @@ class xeniaAlchemy(object):
                         obsName, uom, platformId))
                         return (None)
 
-            sensorRec = sensor(row_entry_date=rowEntryDate,
-                               platform_id=platformId,
-                               m_type_id=mTypeId,
-                               short_name=obsName,
-                               fixed_z=fixedZ,
-                               active=active,
-                               s_order=sOrder)
-            sensorId = self.addRec(sensorRec, True)
-            if (sensorId == None):
-                if (self.logger):
-                    self.logger.error("Unable to add sensor: %s(%s)." % (obsName, uom))
-            else:
-                if (self.logger):
-                    self.logger.debug(
-                        "Added sensor: %s(%s) sOrder: %d on platform: %d" % (obsName, uom, sOrder, platformId))
+        sensorRec = sensor(row_entry_date=rowEntryDate,
+                           platform_id=platformId,
+                           m_type_id=mTypeId,
+                           short_name=obsName,
+                           fixed_z=fixedZ,
+                           active=active,
+                           s_order=sOrder)
+        sensorId = self.addRec(sensorRec, True)
+        if (sensorId == None):
+            if (self.logger):
+                self.logger.error("Unable to add sensor: %s(%s)." % (obsName, uom))
+        else:
+            if (self.logger):
+                self.logger.debug(
+                    "Added sensor: %s(%s) sOrder: %d on platform: %d" % (obsName, uom, sOrder, platformId))
+            platformRec = self.session.get(platform, platformId)
+            if platformRec is not None:
+                self.sensor_cache.put((obsName, uom, platformRec.platform_handle, sOrder), sensorId)
         return (sensorId)
 
+    """
+    Function: resolve_sensors
+    Purpose: Resolves many sensors with one query, see sensor_resolution.resolve_sensors.
+    Parameters:
+      sensor_keys is a list of (obsName, uom, platformHandle, sOrder) tuples.
+    Returns:
+      A tuple of (resolved, unresolved). resolved maps each key found to (sensor_id, m_type_id), unresolved lists
+      the keys that were not found.
+    """
+
+    def resolve_sensors(self, sensor_keys):
+        return resolve_sensors(self, sys.modules[__name__], sensor_keys)
+
+    """
+    Function: metadata_fingerprint
+    Purpose: Returns a value that changes whenever the metadata tables do, see metadata_catalog.metadata_fingerprint.
+    Returns:
+      A tuple of the max row_id, row count and max row_update_date of the metadata tables.
+    """
+
+    def metadata_fingerprint(self):
+        with self.dbEngine.connect() as connection:
+            return metadata_fingerprint(connection, sys.modules[__name__])
+
     """
     Function: mTypeExists
     Purpose: Checks to see if the passed in obsName with the given units of measurement exists in the m_type table.
@@ -590,13 +721,12 @@ class xeniaAlchemy(object):
     """
 
     def mTypeExists(self, obsName, uom):
+        if self.catalog is not None:
+            row_id = self.catalog.mTypeExists(obsName, uom)
+            if row_id is not None:
+                return row_id
         try:
-            rec = self.session.query(m_type.row_id) \
-                .join(m_scalar_type, m_scalar_type.row_id == m_type.m_scalar_type_id) \
-                .join(obs_type, obs_type.row_id == m_scalar_type.obs_type_id) \
-                .join(uom_type, uom_type.row_id == m_scalar_type.uom_type_id) \
-                .filter(obs_type.standard_name == obsName) \
-                .filter(uom_type.standard_name == uom).one()
+            rec = execute_lookup(self.session, self._lookups['m_type'], {'obs_name': obsName, 'uom': uom})
             return (rec.row_id)
         except NoResultFound as e:
             if (self.logger != None):
@@ -621,23 +751,15 @@ class xeniaAlchemy(object):
     """
 
     def addMType(self, scalarID, description=""):
-        rowId = None
-        # At the moment the row_id columns are not autoincrement, so we need to get the max value first.
-        try:
-            nextRowId = self.session.query(func.max(m_type.row_id)).one()[0]
-            nextRowId += 1
-        except Exception as e:
+        # The row_id columns are not autoincrement, so _add_with_row_id takes the id from the allocator.
+        mTypeRec = m_type(num_types=1, m_scalar_type_id=scalarID, description=description)
+        rowId = self._add_with_row_id(mTypeRec)
+        if (rowId == None):
             if (self.logger):
-                self.logger.exception(e)
+                self.logger.error("Unable to add scalarID: %d to m_type table." % (scalarID))
         else:
-            mTypeRec = m_type(row_id=nextRowId, num_types=1, m_scalar_type_id=scalarID, description=description)
-            rowId = self.addRec(mTypeRec, True)
-            if (rowId == None):
-                if (self.logger):
-                    self.logger.error("Unable to add scalarID: %d to m_type table." % (scalarID))
-            else:
-                if (self.logger):
-                    self.logger.debug("Added scalarID: %d to m_type table." % (scalarID))
+            if (self.logger):
+                self.logger.debug("Added scalarID: %d to m_type table." % (scalarID))
         return (rowId)
 
     """
@@ -651,11 +773,13 @@ class xeniaAlchemy(object):
     """
 
     def obsTypeExists(self, obsName):
+        if self.catalog is not None:
+            row_id = self.catalog.obsTypeExists(obsName)
+            if row_id != -1:
+                return row_id
         rowId = None
         try:
-            rec = self.session.query(obs_type.row_id) \
-                .filter(obs_type.standard_name == obsName) \
-                .one()
+            rec = execute_lookup(self.session, self._lookups['obs_type'], {'obs_name': obsName})
             rowId = rec.row_id
         except NoResultFound as e:
             if (self.logger != None):
@@ -677,23 +801,15 @@ class xeniaAlchemy(object):
     """
 
     def addObsType(self, obsName):
-        rowId = None
-        # At the moment the row_id columns are not autoincrement, so we need to get the max value first.
-        try:
-            nextRowId = self.session.query(func.max(obs_type.row_id)).one()[0]
-            nextRowId += 1
-        except Exception as e:
+        # The row_id columns are not autoincrement, so _add_with_row_id takes the id from the allocator.
+        obsTypeRec = obs_type(standard_name=obsName)
+        rowId = self._add_with_row_id(obsTypeRec)
+        if (rowId == None):
             if (self.logger):
-                self.logger.exception(e)
+                self.logger.error("Unable to add obs: %s to obs_type table." % (obsName))
         else:
-            obsTypeRec = obs_type(row_id=nextRowId, standard_name=obsName)
-            rowId = self.addRec(obsTypeRec, True)
-            if (rowId == None):
-                if (self.logger):
-                    self.logger.error("Unable to add obs: %s to obs_type table." % (obsName))
-            else:
-                if (self.logger):
-                    self.logger.debug("Added obs: %s to obs_type table." % (obsName))
+            if (self.logger):
+                self.logger.debug("Added obs: %s to obs_type table." % (obsName))
         return (rowId)
 
     """
@@ -707,11 +823,13 @@ class xeniaAlchemy(object):
     """
 
     def uomTypeExists(self, uomName):
+        if self.catalog is not None:
+            row_id = self.catalog.uomTypeExists(uomName)
+            if row_id != -1:
+                return row_id
         rowId = None
         try:
-            rec = self.session.query(uom_type.row_id) \
-                .filter(uom_type.standard_name == uomName) \
-                .one()
+            rec = execute_lookup(self.session, self._lookups['uom_type'], {'uom': uomName})
             rowId = rec.row_id
         except NoResultFound as e:
             if (self.logger != None):
@@ -732,23 +850,15 @@ class xeniaAlchemy(object):
     """
 
     def addUOMType(self, uomName):
-        rowId = None
-        # At the moment the row_id columns are not autoincrement, so we need to get the max value first.
-        try:
-            nextRowId = self.session.query(func.max(uom_type.row_id)).one()[0]
-            nextRowId += 1
-        except Exception as e:
+        # The row_id columns are not autoincrement, so _add_with_row_id takes the id from the allocator.
+        uomTypeRec = uom_type(standard_name=uomName)
+        rowId = self._add_with_row_id(uomTypeRec)
+        if (rowId == None):
             if (self.logger):
-                self.logger.exception(e)
+                self.logger.error("Unable to add uom: %s to uom_type table." % (uomName))
         else:
-            uomTypeRec = uom_type(row_id=nextRowId, standard_name=uomName)
-            rowId = self.addRec(uomTypeRec, True)
-            if (rowId == None):
-                if (self.logger):
-                    self.logger.error("Unable to add uom: %s to uom_type table." % (uomName))
-            else:
-                if (self.logger):
-                    self.logger.debug("Added uom: %s to obs_type table." % (uomName))
+            if (self.logger):
+                self.logger.debug("Added uom: %s to obs_type table." % (uomName))
         return (rowId)
 
     """
@@ -765,12 +875,14 @@ class xeniaAlchemy(object):
     """
 
     def scalarTypeExists(self, obsTypeID, uomTypeID):
+        if self.catalog is not None:
+            row_id = self.catalog.scalarTypeExists(obsTypeID, uomTypeID)
+            if row_id != -1:
+                return row_id
         rowId = None
         try:
-            rec = self.session.query(m_scalar_type.row_id) \
-                .filter(m_scalar_type.obs_type_id == obsTypeID) \
-                .filter(m_scalar_type.uom_type_id == uomTypeID) \
-                .one()
+            rec = execute_lookup(self.session, self._lookups['scalar_type'],
+                                 {'obs_type_id': obsTypeID, 'uom_type_id': uomTypeID})
             rowId = rec.row_id
         except NoResultFound as e:
             if (self.logger != None):
@@ -797,27 +909,19 @@ class xeniaAlchemy(object):
     """
 
     def addScalarType(self, obsTypeID, uomTypeID):
-        rowId = None
-        # At the moment the row_id columns are not autoincrement, so we need to get the max value first.
-        try:
-            nextRowId = self.session.query(func.max(m_scalar_type.row_id)).one()[0]
-            nextRowId += 1
-        except Exception as e:
+        # The row_id columns are not autoincrement, so _add_with_row_id takes the id from the allocator.
+        scalarRec = m_scalar_type(obs_type_id=obsTypeID, uom_type_id=uomTypeID)
+        rowId = self._add_with_row_id(scalarRec)
+        if (rowId == None):
             if (self.logger):
-                self.logger.exception(e)
+                self.logger.error(
+                    "Unable to add m_scalar_type: obs_type_id: %d  uom_type_id: %d to m_scalar_type table." % (
+                    obsTypeID, uomTypeID))
         else:
-            scalarRec = m_scalar_type(row_id=nextRowId, obs_type_id=obsTypeID, uom_type_id=uomTypeID)
-            rowId = self.addRec(scalarRec, True)
-            if (rowId == None):
-                if (self.logger):
-                    self.logger.error(
-                        "Unable to add m_scalar_type: obs_type_id: %d  uom_type_id: %d to m_scalar_type table." % (
-                        obsTypeID, uomTypeID))
-            else:
-                if (self.logger):
-                    self.logger.debug(
-                        "Added m_scalar_type: obs_type_id: %d  uom_type_id: %d to m_scalar_type table." % (
-                        obsTypeID, uomTypeID))
+            if (self.logger):
+                self.logger.debug(
+                    "Added m_scalar_type: obs_type_id: %d  uom_type_id: %d to m_scalar_type table." % (
+                    obsTypeID, uomTypeID))
         return (rowId)
 
     def getCurrentPlatformStatus(self, platformHandle):
@@ -849,9 +953,7 @@ class xeniaAlchemy(object):
 
     def platformTypeExists(self, platformType):
         try:
-            platRec = self.session.query(platform_type.row_id) \
-                .filter(platform_type.type_name == platformType) \
-                .one()
+            platRec = execute_lookup(self.session, self._lookups['platform_type'], {'type_name': platformType})
             return (platRec.row_id)
         except NoResultFound as e:
             if (self.logger != None):
@@ -875,11 +977,41 @@ class xeniaAlchemy(object):
                 self.logger.exception(e)
         return (platType)
 
+    """
+    Function: _add_with_row_id
+    Purpose: Adds and commits a record of one of the tables whose row_id is not autoincrement, with a row_id from
+    the allocator. If the insert fails because a writer that does not use the allocator took the id, the table's cached
+    block is dropped and the insert is retried once with an id past the table's max(row_id).
+    Parameters:
+      rec is the ORM object to add, without a row_id.
+    Returns:
+      The row_id of the added record, or None if it could not be added.
+    """
+
+    def _add_with_row_id(self, rec):
+        table_name = rec.__tablename__
+        for attempt in range(2):
+            try:
+                if attempt:
+                    self.row_id_allocator.invalidate(table_name)
+                rec.row_id = self.row_id_allocator.next_id(table_name)
+            except Exception as e:
+                self.session.rollback()
+                if (self.logger):
+                    self.logger.exception(e)
+                return None
+            rowId = self.addRec(rec, True)
+            if rowId is not None:
+                return rowId
+        return None
+
     def addRec(self, rec, commit=False):
         try:
             self.session.add(rec)
             if (commit):
                 self.session.commit()
+                if self.catalog is not None:
+                    self.catalog.add_rec(rec)
         # Trying to add record that already exists.
         except exc.IntegrityError as e:
             self.session.rollback()
@@ -893,6 +1025,23 @@ class xeniaAlchemy(object):
     def addSensor(self, sensorRec, commit=False):
         return (self.addRec(sensorRec, commit))
 
+    """
+    Function: provision_platforms
+    Purpose: Adds many platforms and their sensors in one transaction, see platform_provisioning.provision_platforms.
+    Parameters:
+      platform_specs is a list of dictionaries with platform_handle and an observations list in the form
+        buildMinimalPlatform takes.
+    Returns:
+      A dictionary keyed on (obs_name, uom_name, platform_handle, s_order) of (sensor_id, m_type_id).
+    """
+
+    def provision_platforms(self, platform_specs):
+        resolved = provision_platforms(self, sys.modules[__name__], platform_specs, logger=self.logger or None)
+        # The rows were inserted in bulk, not through addRec.
+        if self.catalog is not None:
+            self.catalog.refresh_if_changed()
+        return resolved
+
 
 if __name__ == '__main__':
     xeniaDB = xeniaAlchemy()
@@ -1,8 +1,6 @@
 import logging
-from xeniaSQLAlchemy import xeniaAlchemy, multi_obs, platform
-
-from xeniaSQLiteAlchemy import xeniaAlchemy as xeniaSQLiteAlchemy
-from xeniaSQLiteAlchemy import xeniaAlchemy as sl_xeniaAlchemy, multi_obs as sl_multi_obs, platform as sl_platform
+from .multi_obs_writer import MULTI_OBS_COLUMNS
+from .mapping_cache import MappingCache, engine_fingerprint, state_digest
 
 from datetime import datetime
 import json
@@ -84,10 +82,87 @@ class obs_map:
         self.__m_type_id = m_type_id
 
 
+class obs_row_mapper:
+    """
+    Function: __init__
+    Purpose: Turns parsed source rows into multi_obs tuples in MULTI_OBS_COLUMNS order, ready for the bulk savers or
+    MultiObsBatchWriter. Everything that is the same for every row, the platform, position and each column's
+    sensor_id and m_type_id, is worked out once here so mapping a row is one pass over the mapped columns.
+    Build it with json_obs_map.compile_row_mapper().
+    Parameters:
+      columns is a list of (source key, sensor_id, m_type_id). The key is a column name for dict rows, an index for
+        list rows.
+      date_key is the key of the m_date column.
+      platform_handle, m_lat, m_lon and m_z are used for every observation.
+      value_converter is applied to each source value, None values and values it raises ValueError on are skipped.
+      date_converter, if provided, is applied to the date value.
+    """
+
+    def __init__(self, columns, date_key, platform_handle, m_lat=None, m_lon=None, m_z=None, value_converter=float,
+                 date_converter=None):
+        self._date_key = date_key
+        self._value_converter = value_converter
+        self._date_converter = date_converter
+        template = [None] * len(MULTI_OBS_COLUMNS)
+        template[MULTI_OBS_COLUMNS.index('platform_handle')] = platform_handle
+        template[MULTI_OBS_COLUMNS.index('m_lat')] = m_lat
+        template[MULTI_OBS_COLUMNS.index('m_lon')] = m_lon
+        template[MULTI_OBS_COLUMNS.index('m_z')] = m_z
+        self._columns = []
+        for key, sensor_id, m_type_id in columns:
+            column_template = list(template)
+            column_template[MULTI_OBS_COLUMNS.index('sensor_id')] = sensor_id
+            column_template[MULTI_OBS_COLUMNS.index('m_type_id')] = m_type_id
+            self._columns.append((key, column_template))
+        self._row_entry_date_ndx = MULTI_OBS_COLUMNS.index('row_entry_date')
+        self._m_date_ndx = MULTI_OBS_COLUMNS.index('m_date')
+        self._m_value_ndx = MULTI_OBS_COLUMNS.index('m_value')
+
+    """
+    Function: map_row
+    Purpose: Maps one parsed source row.
+    Parameters:
+      row is a dict keyed on the source column names, or a list indexed by the source column positions.
+      row_entry_date is stored in row_entry_date of every observation.
+    Returns:
+      A list of multi_obs tuples, one per mapped column that had a value.
+    """
+
+    def map_row(self, row, row_entry_date=None):
+        m_date = row[self._date_key]
+        if self._date_converter is not None:
+            m_date = self._date_converter(m_date)
+        value_converter = self._value_converter
+        records = []
+        for key, column_template in self._columns:
+            value = row[key]
+            if value is None:
+                continue
+            if value_converter is not None:
+                try:
+                    value = value_converter(value)
+                except ValueError:
+                    continue
+            rec = list(column_template)
+            rec[self._row_entry_date_ndx] = row_entry_date
+            rec[self._m_date_ndx] = m_date
+            rec[self._m_value_ndx] = value
+            records.append(tuple(rec))
+        return records
+
+    def map_rows(self, rows, row_entry_date=None):
+        records = []
+        for row in rows:
+            records.extend(self.map_row(row, row_entry_date))
+        return records
+
+
 class json_obs_map:
     def __init__(self):
         self.logger = logging.getLogger(type(self).__name__)
         self.obs = []
+        self._source_index = {}
+        self._xenia_index = {}
 
     def load_json_mapping(self, file_name):
         try:
@@ -110,72 +185,270 @@ class json_obs_map:
             if obs['s_order'] is not None:
                 xenia_obs.s_order = obs['s_order']
             self.obs.append(xenia_obs)
+        self.build_indexes()
+
+    """
+    Function: build_indexes
+    Purpose: Builds the source and xenia name lookups. Called by load_json_mapping, through load_json, call it again
+    if self.obs is changed directly. When a name repeats, the first entry wins, the same as a scan of self.obs would
+    find.
+    """
+
+    def build_indexes(self):
+        self._source_index = {}
+        self._xenia_index = {}
+        for obs in self.obs:
+            self._source_index.setdefault(obs.source_obs, obs)
+            self._xenia_index.setdefault(obs.target_obs, obs)
+
+    """
+    Function: build_db_mappings
+    Purpose: Resolves the sensor_id and m_type_id of every mapped observation on the platform, see
+    build_platform_mappings.
+    Parameters:
+      platform_handle is the platform the mapping is for.
+      db, if provided, is a connected xeniaAlchemy object to use. It is left connected.
+      db_engine, if provided, is a SQLAlchemy engine to use.
+      Otherwise a connection is made from sqlite_database_file or from db_connectionstring, db_user, db_password,
+      db_host and db_name, and closed when done.
+      add_missing, if True, sensors, and the types they need, that do not exist are added. The platform must exist.
+      add_missing_platforms, if True, with add_missing the platforms, and their organizations, that do not exist are
+        added as well.
+      mapping_cache_file, if provided, is a MappingCache file the resolved ids are kept in between runs. A platform
+        found there is set up without resolving its sensors, as long as the metadata tables have not changed.
+      mapping_cache_max_age, if provided, is the number of seconds a cached mapping is trusted.
+    """
 
     def build_db_mappings(self, **kwargs):
-        add_missing = kwargs.get('add_missing', False)
-        if kwargs.get('sqlite_database_file', None) is None:
-            db = xeniaAlchemy()
-            if (db.connectDB(kwargs['db_connectionstring'],
-                             kwargs['db_user'],
-                             kwargs['db_password'],
-                             kwargs['db_host'],
-                             kwargs['db_name'],
-                             False) == True):
-                self.logger.info("Succesfully connect to DB: %s at %s" % (kwargs['db_name'], kwargs['db_host']))
-            else:
-                self.logger.error(
-                    "Unable to connect to DB: %s at %s. Terminating script." % (kwargs['db_name'], kwargs['db_host']))
-        else:
-            db_file = kwargs['sqlite_database_file']
-            db = sl_xeniaAlchemy()
-            if db.connectDB('sqlite', None, None, db_file, None, False):
-                self.logger.info("Succesfully connect to DB: %s" % (db_file))
-            else:
-                self.logger.error("Unable to connect to DB: %s" % (db_file))
+        build_platform_mappings({kwargs['platform_handle']: self}, **kwargs)
 
-        entry_date = datetime.now()
-        for obs_rec in self.obs:
-            if obs_rec.target_obs != 'm_date':
-                self.logger.debug("Platform: %s checking sensor exists %s(%s) s_order: %d" % (kwargs['platform_handle'],
-                                                                                              obs_rec.target_obs,
-                                                                                              obs_rec.target_uom,
-                                                                                              obs_rec.s_order))
-                sensor_id = db.sensorExists(obs_rec.target_obs, obs_rec.target_uom, kwargs['platform_handle'],
-                                            obs_rec.s_order)
-                if sensor_id is None:
-                    self.logger.debug("Sensor does not exist, adding")
-                    platform_id = db.platformExists(kwargs['platform_handle'])
-                    sensor_id = db.newSensor(entry_date.strftime('%Y-%m-%d %H:%M:%S'),
-                                             obs_rec.target_obs,
-                                             obs_rec.target_uom,
-                                             platform_id,
-                                             1,
-                                             0,
-                                             obs_rec.s_order,
-                                             None,
-                                             add_missing)
-                obs_rec.sensor_id = sensor_id
-                m_type_id = db.mTypeExists(obs_rec.target_obs, obs_rec.target_uom)
-                obs_rec.m_type_id = m_type_id
-        db.disconnect()
+    def sensor_keys(self, platform_handle):
+        return [(obs_rec.target_obs, obs_rec.target_uom, platform_handle, obs_rec.s_order)
+                for obs_rec in self.obs if obs_rec.target_obs != 'm_date']
 
     def get_date_field(self):
-        for obs in self.obs:
-            if obs.target_obs == 'm_date':
-                return obs
+        return self._xenia_index.get('m_date')
 
     def get_rec_from_source_name(self, name):
-        for obs in self.obs:
-            if obs.source_obs == name:
-                return obs
-        return None
+        return self._source_index.get(name)
 
     def get_rec_from_xenia_name(self, name):
+        return self._xenia_index.get(name)
+
+    """
+    Function: compile_row_mapper
+    Purpose: Builds an obs_row_mapper for the mapped columns that build_db_mappings resolved a sensor for.
+    Parameters:
+      platform_handle is the platform the rows are from.
+      header, if provided, is the list of source column names of list rows. Each column is then read by its position
+        in header, otherwise by source_index if set, otherwise by its source name from dict rows.
+      kwargs are passed to obs_row_mapper: m_lat, m_lon, m_z, value_converter, date_converter.
+    Returns:
+      The obs_row_mapper.
+    """
+
+    def compile_row_mapper(self, platform_handle, header=None, **kwargs):
+        header_index = None
+        if header is not None:
+            header_index = {}
+            for ndx, name in enumerate(header):
+                header_index.setdefault(name, ndx)
+
+        def source_key(obs):
+            if header_index is not None:
+                return header_index[obs.source_obs]
+            if obs.source_index is not None:
+                return obs.source_index
+            return obs.source_obs
+
+        date_field = self.get_date_field()
+        if date_field is None:
+            raise ValueError("The mapping has no m_date column.")
+        columns = []
         for obs in self.obs:
-            if obs.target_obs == name:
-                return obs
-        return None
+            if obs.target_obs == 'm_date':
+                continue
+            if obs.sensor_id is None:
+                self.logger.warning("Platform: %s %s(%s) has no sensor_id, column %s is not mapped." % (
+                    platform_handle, obs.target_obs, obs.target_uom, obs.source_obs))
+                continue
+            columns.append((source_key(obs), obs.sensor_id, obs.m_type_id))
+        return obs_row_mapper(columns, source_key(date_field), platform_handle, **kwargs)
 
     def __iter__(self):
         for obs_rec in self.obs:
             yield obs_rec
+
+
+"""
+Function: connect_mapping_db
+Purpose: Returns the xeniaAlchemy object build_platform_mappings works with.
+Parameters:
+  kwargs as described in json_obs_map.build_db_mappings.
+Returns:
+  A tuple of (db, owned). owned is True when the connection was made here and should be closed by the caller.
+"""
+
+
+def connect_mapping_db(**kwargs):
+    # The ORM modules are only imported when a mapping has to be resolved from the database, so a job that only
+    # parses rows does not load them.
+    from .xeniaSQLAlchemy import xeniaAlchemy
+    from .xeniaSQLiteAlchemy import xeniaAlchemy as sl_xeniaAlchemy
+    logger = logging.getLogger(__name__)
+    if kwargs.get('db', None) is not None:
+        return kwargs['db'], False
+
+    if kwargs.get('db_engine', None) is not None:
+        engine = kwargs['db_engine']
+        if engine.dialect.name == 'postgresql':
+            db = xeniaAlchemy()
+        else:
+            db = sl_xeniaAlchemy()
+        db.attach_engine(engine)
+        return db, True
+
+    if kwargs.get('sqlite_database_file', None) is None:
+        db = xeniaAlchemy()
+        if db.connectDB(kwargs['db_connectionstring'],
+                        kwargs['db_user'],
+                        kwargs['db_password'],
+                        kwargs['db_host'],
+                        kwargs['db_name'],
+                        False):
+            logger.info("Succesfully connect to DB: %s at %s" % (kwargs['db_name'], kwargs['db_host']))
+        else:
+            logger.error("Unable to connect to DB: %s at %s." % (kwargs['db_name'], kwargs['db_host']))
+            raise Exception("Unable to connect to database")
+    else:
+        db_file = kwargs['sqlite_database_file']
+        db = sl_xeniaAlchemy()
+        if db.connect_sqlite_db(db_file):
+            logger.info("Succesfully connect to DB: %s" % (db_file))
+        else:
+            logger.error("Unable to connect to DB: %s" % (db_file))
+            raise Exception("Unable to connect to database")
+    return db, True
+
+
+"""
+Function: mapping_db_fingerprint
+Purpose: Builds the fingerprint mapping cache entries are stored under: the database the connection points at plus
+the state of its metadata tables, so ids cached before a sensor or platform was added, removed or changed are not
+used.
+Parameters:
+  db is the connected xeniaAlchemy object.
+Returns:
+  The fingerprint string.
+"""
+
+
+def mapping_db_fingerprint(db):
+    return "%s#%s" % (engine_fingerprint(db.dbEngine), state_digest(db.metadata_fingerprint()))
+
+
+"""
+Function: build_platform_mappings
+Purpose: Resolves the sensor_id and m_type_id of every mapped observation for many platforms at once. All the
+platforms' sensors are looked up with one resolve_sensors call. The missing ones are added with one bulk provisioning
+call when add_missing is True, on the platforms that exist unless add_missing_platforms is also True. With a
+mapping_cache_file, platforms found in the cache are not looked up. Checking the cache costs one metadata_fingerprint
+query.
+Parameters:
+  mappings is a dictionary of platform_handle: json_obs_map. The ids are stored on the json_obs_map obs records, so
+    each platform needs its own json_obs_map object.
+  kwargs are the connection and add_missing options described in json_obs_map.build_db_mappings.
+Returns:
+  The list of (obs, uom, platform_handle, s_order) keys that are still unresolved.
+"""
+
+
+def build_platform_mappings(mappings, **kwargs):
+    logger = logging.getLogger(__name__)
+    if len({id(obs_mapping) for obs_mapping in mappings.values()}) != len(mappings):
+        raise ValueError("Each platform needs its own json_obs_map.")
+
+    mapping_cache = None
+    db = None
+    owned = False
+    try:
+        if kwargs.get('mapping_cache_file', None) is not None:
+            mapping_cache = MappingCache(kwargs['mapping_cache_file'], kwargs.get('mapping_cache_max_age', None))
+            db, owned = connect_mapping_db(**kwargs)
+            fingerprint = mapping_db_fingerprint(db)
+
+        resolved = {}
+        platform_keys = {}
+        sensor_keys = []
+        for platform_handle, obs_mapping in mappings.items():
+            keys = obs_mapping.sensor_keys(platform_handle)
+            cached = None
+            if mapping_cache is not None:
+                cached = mapping_cache.get(platform_handle, keys, fingerprint)
+            if cached is not None:
+                resolved.update(cached)
+            else:
+                platform_keys[platform_handle] = keys
+                sensor_keys.extend(keys)
+
+        unresolved = []
+        if sensor_keys:
+            if db is None:
+                db, owned = connect_mapping_db(**kwargs)
+            unresolved = _resolve_mappings(db, sensor_keys, resolved, **kwargs)
+            if mapping_cache is not None:
+                # Adding missing sensors changes the metadata tables, and so the fingerprint.
+                fingerprint = mapping_db_fingerprint(db)
+                missing_platforms = {key[2] for key in unresolved}
+                for platform_handle, keys in platform_keys.items():
+                    if platform_handle not in missing_platforms:
+                        mapping_cache.put(platform_handle, keys, fingerprint, resolved)
+                mapping_cache.save()
+    finally:
+        if owned:
+            db.disconnect()
+
+    for key in unresolved:
+        logger.error("Platform: %s sensor: %s(%s) s_order: %s does not exist." % (key[2], key[0], key[1], key[3]))
+    for platform_handle, obs_mapping in mappings.items():
+        for obs_rec in obs_mapping.obs:
+            if obs_rec.target_obs != 'm_date':
+                obs_rec.sensor_id, obs_rec.m_type_id = resolved.get(
+                    (obs_rec.target_obs, obs_rec.target_uom, platform_handle, obs_rec.s_order), (None, None))
+    return unresolved
+
+
+def _resolve_mappings(db, sensor_keys, resolved, **kwargs):
+    logger = logging.getLogger(__name__)
+    add_missing = kwargs.get('add_missing', False)
+    add_missing_platforms = kwargs.get('add_missing_platforms', False)
+    db_resolved, unresolved = db.resolve_sensors(sensor_keys)
+    resolved.update(db_resolved)
+    if unresolved and add_missing:
+        addable = unresolved
+        if not add_missing_platforms:
+            # Like newSensor, only add sensors to platforms that already exist.
+            platform_handles = {key[2] for key in unresolved}
+            existing = {platform_handle for platform_handle in platform_handles
+                        if db.platformExists(platform_handle) is not None}
+            addable = [key for key in unresolved if key[2] in existing]
+        logger.debug("Adding %d missing sensors." % (len(addable)))
+        platform_specs = {}
+        for obs_name, uom, platform_handle, s_order in addable:
+            platform_specs.setdefault(platform_handle, {'platform_handle': platform_handle, 'observations': []})
+            platform_specs[platform_handle]['observations'].append({'obs_name': obs_name, 'uom_name': uom,
+                                                                    's_order': s_order})
+        if platform_specs:
+            resolved.update(db.provision_platforms(list(platform_specs.values())))
+    elif unresolved:
+        # Without add_missing a sensor is only added when its platform and m_type already exist.
+        entry_date = datetime.now()
+        for obs_name, uom, platform_handle, s_order in unresolved:
+            platform_id = db.platformExists(platform_handle)
+            m_type_id = db.mTypeExists(obs_name, uom)
+            if platform_id is not None and m_type_id is not None:
+                sensor_id = db.newSensor(entry_date.strftime('%Y-%m-%d %H:%M:%S'), obs_name, uom, platform_id,
+                                         1, 0, s_order, m_type_id, False)
+                if sensor_id is not None:
+                    resolved[(obs_name, uom, platform_handle, s_order)] = (sensor_id, m_type_id)
+    return [key for key in unresolved if key not in resolved]